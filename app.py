@@ -6,115 +6,58 @@ from extensions import db
 from flask_wtf.csrf import CSRFProtect
 from dotenv import load_dotenv
 import os
-from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
-from datetime import datetime
-from models import Message, MessageRecipient, Participant
-from routes import send_messages_now, send_messages_now_backup
-import socket
-from contextlib import contextmanager
-from sqlalchemy import create_engine, text
-import time
+from models import Conference
+from outbox import init_outbox
+from receipts import init_receipts
+from scheduler import MessageScheduler
+from senders import SenderPool
+from retries import RetryPolicy
+from providers import create_provider
+from cache import conference_cache
+from metrics import init_metrics
+from db_pool import engine_options, init_pool_metrics
+from sqlalchemy.exc import SQLAlchemyError
 
 csrf = CSRFProtect()
 load_dotenv()
 
-def get_lock(session, lock_name):
-    """Try to obtain a PostgreSQL advisory lock"""
-    # Convert lock_name to a 64-bit integer
-    lock_id = hash(lock_name) % 2**63
-    
-    # Try to get the lock
-    result = session.execute(
-        text('SELECT pg_try_advisory_lock(:lock_id)'),
-        {'lock_id': lock_id}
-    ).scalar()
-    
-    return result
-
-def release_lock(session, lock_name):
-    """Release a PostgreSQL advisory lock"""
-    lock_id = hash(lock_name) % 2**63
-    session.execute(
-        text('SELECT pg_advisory_unlock(:lock_id)'),
-        {'lock_id': lock_id}
-    )
-
 def init_scheduler(app):
-    """Initialize the scheduler with worker-level locking"""
-    def process_scheduled_messages():
-        """Send messages that are due for delivery with lock protection"""
-        with app.app_context():
-            # Get a database session
-            session = db.session()
-            acquired = False
-
-            try:
-                acquired = get_lock(session, 'scheduler_lock')
-                # Try to acquire the lock
-                if not acquired:
-                    app.logger.info("Another worker is processing messages, skipping this run")
-                    return
-
-                app.logger.info("Acquired scheduler lock, processing messages")
-                
-                now = datetime.now()
-                scheduled_messages = Message.query.filter(
-                    Message.status == 'scheduled',
-                    Message.scheduled_at <= now
-                ).all()
-
-                for message in scheduled_messages:
-                    try:
-                        recipient_entries = MessageRecipient.query.filter_by(message_id=message.id).all()
-                        recipients = [entry.participant for entry in recipient_entries]
-
-                        if not recipients:
-                            continue
-
-                        if not send_messages_now(message, recipients):
-                            send_messages_now_backup(message, recipients)
-                            
-                        message.status = "sent"
-                        message.sent_at = datetime.now()
-                        db.session.commit()
-                        
-                    except Exception as e:
-                        app.logger.error(f"Error processing message {message.id}: {str(e)}")
-                        message.status = "error"
-                        db.session.commit()
-                        continue
-
-            except Exception as e:
-                app.logger.error(f"Scheduler error: {str(e)}")
-                
-            finally:
-                if acquired:
-                    # Always release the lock
-                    release_lock(session, 'scheduler_lock')
-                session.close()
-
-    # Only initialize scheduler on the first worker
-    is_first_worker = False
-    try:
-        # Try to bind to the port - only first worker will succeed
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(('localhost', 7999))
-        is_first_worker = True
-        sock.close()
-    except:
-        pass
-
-    if is_first_worker:
-        app.logger.info("Initializing scheduler on primary worker")
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(process_scheduled_messages, 'interval', minutes=1)
-        scheduler.start()
-        
-        # Shut down scheduler when exiting app
-        atexit.register(lambda: scheduler.shutdown())
-    else:
-        app.logger.info("Secondary worker - skipping scheduler initialization")
+    """Attach a message scheduler to the app.
+
+    Every web process runs one (see start_background_workers); claims on the
+    message rows keep replicas from sending the same scheduled message twice.
+    """
+    scheduler = MessageScheduler(
+        app,
+        reconcile_interval=app.config['SCHEDULER_RECONCILE_INTERVAL'],
+        lease_seconds=app.config['SCHEDULER_LEASE_SECONDS']
+    )
+    app.extensions['message_scheduler'] = scheduler
+    return scheduler
+
+def start_background_workers(app):
+    """Start the message scheduler, and the outbox worker if OUTBOX_WORKER is embedded.
+
+    Only the serving entry points call this (gunicorn.conf.py and `python app.py`),
+    so scripts and CLI commands that build the app never start sending messages.
+    """
+    message_scheduler = app.extensions['message_scheduler']
+    message_scheduler.start()
+    atexit.register(message_scheduler.stop)
+    if app.config['OUTBOX_WORKER'] == 'embedded':
+        app.extensions['outbox_worker'].start()
+
+def seed_conferences(app):
+    """Create the default conferences and reset the cached conference metadata."""
+    with app.app_context():
+        try:
+            Conference.init_default_conferences()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        finally:
+            conference_cache.invalidate()
 
 def create_app(config_class=None):
     app = Flask(__name__)
@@ -138,7 +81,76 @@ def create_app(config_class=None):
         app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///munnw_sms.db"
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['UPLOAD_FOLDER'] = 'uploads'
+    # connection pool settings from db_pool.POOL_PROFILES ("default", "small", "large" or "pgbouncer"); the DB_* keys below override single settings
+    app.config.setdefault('DB_POOL_PROFILE', os.environ.get('DB_POOL_PROFILE', 'default'))
+    app.config.setdefault('DB_POOL_SIZE', os.environ.get('DB_POOL_SIZE'))
+    app.config.setdefault('DB_MAX_OVERFLOW', os.environ.get('DB_MAX_OVERFLOW'))
+    app.config.setdefault('DB_POOL_TIMEOUT', os.environ.get('DB_POOL_TIMEOUT'))
+    app.config.setdefault('DB_POOL_RECYCLE', os.environ.get('DB_POOL_RECYCLE'))
+    app.config.setdefault('DB_POOL_PRE_PING', os.environ.get('DB_POOL_PRE_PING'))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    # where uploaded participant CSVs wait for their import job
+    app.config.setdefault('UPLOAD_FOLDER', os.environ.get('UPLOAD_FOLDER', 'uploads'))
+    # an import whose heartbeat has been silent this many seconds is taken to have died with its process
+    app.config.setdefault('IMPORT_JOB_TIMEOUT', float(os.environ.get('IMPORT_JOB_TIMEOUT', 300)))
+    # how many SMS requests the async dispatcher keeps in flight at once
+    app.config.setdefault('SMS_DISPATCH_CONCURRENCY', int(os.environ.get('SMS_DISPATCH_CONCURRENCY', 100)))
+    # "twilio" for real sends, "fake" for an in-process provider with simulated latency and errors
+    app.config.setdefault('SMS_PROVIDER', os.environ.get('SMS_PROVIDER', 'twilio'))
+    app.config.setdefault('TWILIO_ACCOUNT_SID', os.environ.get('TWILIO_ACCOUNT_SID'))
+    app.config.setdefault('TWILIO_AUTH_TOKEN', os.environ.get('TWILIO_AUTH_TOKEN'))
+    # provider connections are pooled per process (SMS_DISPATCH_CONCURRENCY of them) and kept open this many idle seconds
+    app.config.setdefault('SMS_HTTP_KEEPALIVE', float(os.environ.get('SMS_HTTP_KEEPALIVE', 30)))
+    app.config.setdefault('SMS_HTTP_CONNECT_TIMEOUT', float(os.environ.get('SMS_HTTP_CONNECT_TIMEOUT', 5)))
+    app.config.setdefault('SMS_HTTP_READ_TIMEOUT', float(os.environ.get('SMS_HTTP_READ_TIMEOUT', 15)))
+    app.config.setdefault('SMS_FAKE_LATENCY', float(os.environ.get('SMS_FAKE_LATENCY', 0.05)))
+    app.config.setdefault('SMS_FAKE_JITTER', float(os.environ.get('SMS_FAKE_JITTER', 0)))
+    app.config.setdefault('SMS_FAKE_ERROR_RATE', float(os.environ.get('SMS_FAKE_ERROR_RATE', 0)))
+    app.config.setdefault('SMS_FAKE_THROTTLE_RATE', float(os.environ.get('SMS_FAKE_THROTTLE_RATE', 0)))
+    # sending numbers share the load; each is held to SMS_SENDER_RATE messages per second, so a blast runs at the
+    # sum of the numbers' rates. The default of 1 per second with a burst of 1 is a long code's limit: a
+    # 3,000-recipient blast from one number takes about 50 minutes, whatever SMS_DISPATCH_CONCURRENCY is. Add
+    # numbers, or a messaging service with more throughput, to go faster.
+    app.config.setdefault('TWILIO_PHONE_NUMBERS', os.environ.get('TWILIO_PHONE_NUMBERS', os.environ.get('TWILIO_PHONE_NUMBER', '')))
+    app.config.setdefault('TWILIO_MESSAGING_SERVICE_SID', os.environ.get('TWILIO_MESSAGING_SERVICE_SID'))
+    app.config.setdefault('SMS_SENDER_RATE', float(os.environ.get('SMS_SENDER_RATE', 1)))
+    app.config.setdefault('SMS_SENDER_BURST', int(os.environ.get('SMS_SENDER_BURST', 1)))
+    # rate limits are kept per process, so the rate and burst are split evenly over the processes that deliver:
+    # the `flask outbox-worker` processes with OUTBOX_WORKER=external (scheduled messages are handed to them too),
+    # every web worker with OUTBOX_WORKER=embedded. Several of them only run at the full rate together.
+    app.config.setdefault('SMS_DELIVERY_PROCESSES', int(os.environ.get('SMS_DELIVERY_PROCESSES', 1)))
+    # "embedded" runs an outbox worker thread in every web process, "external" leaves delivery to `flask outbox-worker`
+    app.config.setdefault('OUTBOX_WORKER', os.environ.get('OUTBOX_WORKER', 'embedded'))
+    app.config.setdefault('OUTBOX_BATCH_SIZE', int(os.environ.get('OUTBOX_BATCH_SIZE', 500)))
+    app.config.setdefault('OUTBOX_POLL_INTERVAL', float(os.environ.get('OUTBOX_POLL_INTERVAL', 2)))
+    # an outbox worker that stops renewing its claim on a batch for this long is presumed dead
+    app.config.setdefault('OUTBOX_LEASE_SECONDS', float(os.environ.get('OUTBOX_LEASE_SECONDS', 300)))
+    # how often the scheduler re-reads scheduled messages, to see ones scheduled through other processes
+    app.config.setdefault('SCHEDULER_RECONCILE_INTERVAL', float(os.environ.get('SCHEDULER_RECONCILE_INTERVAL', 30)))
+    # scheduled sends stream their recipients from the database this many rows at a time
+    app.config.setdefault('SCHEDULER_RECIPIENT_CHUNK_SIZE', int(os.environ.get('SCHEDULER_RECIPIENT_CHUNK_SIZE', 1000)))
+    # public URL of the /sms/status endpoint; sends ask the provider to post delivery receipts there when set
+    app.config.setdefault('SMS_STATUS_CALLBACK_URL', os.environ.get('SMS_STATUS_CALLBACK_URL'))
+    app.config.setdefault('SMS_STATUS_CALLBACK_VALIDATE', os.environ.get('SMS_STATUS_CALLBACK_VALIDATE', '1') == '1')
+    app.config.setdefault('SMS_STATUS_CALLBACK_RECORD_PATH', os.environ.get('SMS_STATUS_CALLBACK_RECORD_PATH'))
+    app.config.setdefault('RECEIPT_FLUSH_SIZE', int(os.environ.get('RECEIPT_FLUSH_SIZE', 1000)))
+    app.config.setdefault('RECEIPT_FLUSH_INTERVAL', float(os.environ.get('RECEIPT_FLUSH_INTERVAL', 1)))
+    # delivery outcomes are written back to recipient rows in batches of this many, or at least this often
+    app.config.setdefault('DELIVERY_FLUSH_SIZE', int(os.environ.get('DELIVERY_FLUSH_SIZE', 500)))
+    app.config.setdefault('DELIVERY_FLUSH_INTERVAL', float(os.environ.get('DELIVERY_FLUSH_INTERVAL', 0.5)))
+    # failed sends that may succeed later are retried with exponential backoff, up to SMS_MAX_ATTEMPTS sends in total
+    app.config.setdefault('SMS_MAX_ATTEMPTS', int(os.environ.get('SMS_MAX_ATTEMPTS', 3)))
+    app.config.setdefault('SMS_RETRY_BASE_DELAY', float(os.environ.get('SMS_RETRY_BASE_DELAY', 30)))
+    app.config.setdefault('SMS_RETRY_MAX_DELAY', float(os.environ.get('SMS_RETRY_MAX_DELAY', 900)))
+    # bearer token required to scrape /metrics; unset keeps the endpoint closed
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    # port where `flask outbox-worker`, which has no web server, serves its own /metrics; unset serves none
+    app.config.setdefault('METRICS_PORT', int(os.environ['METRICS_PORT']) if os.environ.get('METRICS_PORT') else None)
+    # directory where every process on the host writes its metrics, merged by /metrics; unset keeps them per process
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+    app.config.setdefault('METRICS_WRITE_INTERVAL', float(os.environ.get('METRICS_WRITE_INTERVAL', 5)))
+    # a scheduler that stops renewing its claim on a message for this long is presumed dead
+    app.config.setdefault('SCHEDULER_LEASE_SECONDS', float(os.environ.get('SCHEDULER_LEASE_SECONDS', 300)))
 
     # app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     # print(f"SQLAlchemy URI: {app.config['SQLALCHEMY_DATABASE_URI']}")
@@ -146,6 +158,12 @@ def create_app(config_class=None):
     # Initialize db with app here
     db.init_app(app)
     csrf.init_app(app)
+    app.extensions['sender_pool'] = SenderPool.from_config(app.config)
+    app.extensions['sms_provider'] = create_provider(app.config)
+    app.extensions['retry_policy'] = RetryPolicy.from_config(app.config)
+
+    init_metrics(app)
+    init_pool_metrics(app)
 
     # Initialize the login manager
     login_manager = LoginManager()
@@ -163,15 +181,29 @@ def create_app(config_class=None):
 
     migrate = Migrate(app, db)
 
-    from routes import routes
+    @app.cli.command('seed-conferences')
+    def seed_conferences_command():
+        """Create the default conferences if they are missing."""
+        seed_conferences(app)
+
+    # once per process instead of on every request; tables may not exist yet before the first migration
+    try:
+        seed_conferences(app)
+    except SQLAlchemyError as e:
+        app.logger.warning(f"Skipping default conference seeding: {str(e)}")
+
+    from routes import routes, sms_status_callback
     app.register_blueprint(routes, url_prefix='/')
+    # the provider can't send a CSRF token; requests are checked against its signature instead
+    csrf.exempt(sms_status_callback)
 
-    # Initialize scheduler only in production
-    if not app.debug:
-        init_scheduler(app)
+    init_outbox(app)
+    init_scheduler(app)
+    init_receipts(app)
 
     return app
 
 if __name__ == "__main__":
     app = create_app()
+    start_background_workers(app)
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), debug=False)
\ No newline at end of file
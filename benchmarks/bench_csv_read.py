@@ -0,0 +1,88 @@
+"""Benchmark CSV format detection and parsing on multi-megabyte uploads.
+
+Builds large files from the rows in test_csv/ in several encodings and
+delimiters, then times try_read_csv plus a full pass over the rows, next to
+the previous implementation that retried each encoding in turn.
+
+    python benchmarks/bench_csv_read.py [target_megabytes]
+"""
+import csv
+import glob
+import io
+import os
+import sys
+import time
+from io import TextIOWrapper
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from routes import try_read_csv
+
+TEST_CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_csv')
+
+
+def legacy_try_read_csv(file):
+    """try_read_csv before single-pass detection, kept here for comparison."""
+    for encoding in ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252']:
+        try:
+            file.seek(0)
+            reader = csv.DictReader(TextIOWrapper(file, encoding=encoding))
+            if not reader.fieldnames:
+                continue
+            reader.fieldnames = [field.strip().lstrip('﻿') for field in reader.fieldnames]
+            return reader, set(reader.fieldnames)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Unable to read CSV file with any supported encoding")
+
+
+def build_file(path, target_bytes, encoding, delimiter=',', accented=False):
+    """Repeat the rows of a test_csv file until the output reaches target_bytes."""
+    with open(path, newline='', encoding='utf-8') as source:
+        rows = list(csv.reader(source))
+    header, body = rows[0], rows[1:]
+    if accented:
+        body = [[row[0] + 'é'] + row[1:] for row in body]
+
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=delimiter)
+    writer.writerow(header)
+    chunk = io.StringIO()
+    csv.writer(chunk, delimiter=delimiter).writerows(body)
+    chunk = chunk.getvalue()
+    copies = max(1, target_bytes // max(1, len(chunk.encode(encoding))))
+    out.write(chunk * copies)
+    return out.getvalue().encode(encoding)
+
+
+def time_reader(read_csv, data):
+    start = time.perf_counter()
+    reader, _ = read_csv(io.BytesIO(data))
+    rows = sum(1 for _ in reader)
+    return rows, time.perf_counter() - start
+
+
+def main():
+    target_bytes = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 8 * 1024 * 1024
+    variants = [
+        ('utf-8', ',', False),
+        ('utf-8-sig', ',', True),
+        ('cp1252', ',', True),
+        ('utf-8', ';', False),
+    ]
+
+    print(f"{'source':<28} {'format':<16} {'MB':>6} {'rows':>9} {'new s':>7} {'legacy s':>9}")
+    for path in sorted(glob.glob(os.path.join(TEST_CSV_DIR, '*.csv'))):
+        for encoding, delimiter, accented in variants:
+            data = build_file(path, target_bytes, encoding, delimiter, accented)
+            rows, elapsed = time_reader(try_read_csv, data)
+            try:
+                _, legacy_elapsed = time_reader(legacy_try_read_csv, data)
+                legacy = f'{legacy_elapsed:9.3f}'
+            except Exception as e:
+                legacy = type(e).__name__
+            label = f'{encoding} {delimiter!r}'
+            print(f'{os.path.basename(path):<28} {label:<16} {len(data) / 1048576:6.1f} {rows:9d} {elapsed:7.3f} {legacy:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""End-to-end benchmark of a synthetic conference, from CSV upload to scheduled send.
+
+For every database and conference size it starts from empty tables, then
+drives the app through its own routes with the Flask test client:
+
+    csv_upload        POST /upload_participants with a generated CSV, until the import job finishes
+    search            GET /manage_participants as the search box does, over a fixed set of terms
+    dashboard         GET /dashboard
+    blast             POST /send_message to everyone, then drain the outbox
+    scheduled_send    a message scheduled for now, picked up and sent by the scheduler thread
+
+SMS go to the in-process fake provider (SMS_PROVIDER=fake) with a fixed
+latency per send, so the numbers measure the app and the database rather
+than Twilio.
+
+Each run writes one JSON file of results. Pass an earlier one with --compare
+to list the benchmarks that got slower by more than --tolerance; the exit
+status is 1 when any did, so the comparison can gate a release.
+
+--database takes "sqlite" (a throwaway file) or a SQLAlchemy URL and can be
+repeated. Only point it at a scratch database: tables are dropped and
+recreated for every size.
+
+    python benchmarks/bench_end_to_end.py
+    python benchmarks/bench_end_to_end.py --sizes 1000 10000 100000 \\
+        --database sqlite --database postgresql://localhost/pacmun_bench
+    python benchmarks/bench_end_to_end.py --compare benchmarks/results/e2e-baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+
+from app import create_app
+from extensions import db
+from models import Admin, Conference, Message, MessageRecipient
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+FIRST_NAMES = [
+    'Aisha', 'Alexandra', 'Ana', 'Ben', 'Chen', 'Charlie', 'Daniel', 'Emma', 'Eric', 'Fatima', 'Gwen',
+    'Hiro', 'Isabel', 'Jamal', 'Julia', 'Kai', 'Liam', 'Lucia', 'Madeline', 'Mateo', 'Mina', 'Misha',
+    'Noah', 'Olivia', 'Parth', 'Priya', 'Raika', 'Sam', 'Sofia', 'Thomas', 'Wei', 'Yusuf', 'Zoe',
+]
+LAST_NAMES = [
+    'Alemshowa', 'Anderson', 'Choudhury', 'Chen', 'Garcia', 'Hui', 'Johnson', 'Kim', 'Kotwal', 'Lee',
+    'Liu', 'Martinez', 'Nair', 'Nguyen', 'Okafor', 'Patel', 'Rana', 'Rossi', 'Seet', 'Singh', 'Smith',
+    'Solan', 'Tanaka', 'Tsai', 'Williams', 'Yamamoto',
+]
+# roughly the mix of a real conference
+PARTICIPANT_TYPES = [('Delegate', 0.85), ('Advisor', 0.07), ('Staff', 0.05), ('Secretariat', 0.03)]
+
+# what people type into the participant search box: names, fragments, phone digits, and a miss
+SEARCH_TERMS = ['', 'Ch', 'Chen', 'liu', 'ali', 'son', 'Sofia Gar', '206555', '1234', 'xqzw']
+
+
+class BenchConfig:
+    WTF_CSRF_ENABLED = False
+    SMS_PROVIDER = 'fake'
+    SMS_FAKE_JITTER = 0
+    SMS_FAKE_THROTTLE_RATE = 0
+    TWILIO_PHONE_NUMBERS = '+15550000001,+15550000002,+15550000003'
+    SMS_SENDER_RATE = 1e9
+    SMS_SENDER_BURST = 1000000
+    # failed sends are final, so a blast finishes in one pass over the outbox
+    SMS_MAX_ATTEMPTS = 1
+
+
+def build_csv(size, seed=0):
+    """A participant CSV of `size` rows with unique phone numbers."""
+    rng = random.Random(seed)
+    types, weights = zip(*PARTICIPANT_TYPES)
+    lines = ['first_name,last_name,phone,participant_type']
+    for i in range(size):
+        lines.append(
+            f'{rng.choice(FIRST_NAMES)},{rng.choice(LAST_NAMES)},+1206{i:07d},{rng.choices(types, weights)[0]}'
+        )
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_result(samples):
+    return {
+        'seconds': statistics.median(samples),
+        'p95_seconds': percentile(samples, 0.95),
+        'max_seconds': max(samples),
+        'requests': len(samples),
+    }
+
+
+class Run:
+    """One database at one conference size, from empty tables."""
+
+    def __init__(self, database_url, size, args):
+        os.environ['DATABASE_URL'] = database_url
+        config = type('RunConfig', (BenchConfig,), {
+            'SMS_FAKE_LATENCY': args.latency,
+            'SMS_FAKE_ERROR_RATE': args.error_rate,
+            'SMS_DISPATCH_CONCURRENCY': args.concurrency,
+            'UPLOAD_FOLDER': tempfile.mkdtemp(prefix='bench-uploads-'),
+        })
+        self.app = create_app(config)
+        self.app.logger.setLevel('WARNING')
+        self.size = size
+        self.args = args
+
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            Conference.init_default_conferences()
+            admin = Admin(username='bench', conference_id=1)
+            admin.set_password('bench')
+            db.session.add(admin)
+            db.session.commit()
+            self.dialect = db.engine.dialect.name
+
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+    def get(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        assert response.status_code == 200, (url, response.status_code)
+        return response
+
+    def csv_upload(self):
+        data = build_csv(self.size)
+        started = time.perf_counter()
+        response = self.client.post(
+            '/upload_participants',
+            data={'file': (io.BytesIO(data), 'participants.csv')},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 202, response.get_json()
+        job_url = f"/upload_participants/jobs/{response.get_json()['job_id']}"
+        while True:
+            job = self.get(job_url).get_json()
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.02)
+        seconds = time.perf_counter() - started
+
+        assert job['status'] == 'done' and job['success_count'] == self.size, job
+        return {'seconds': seconds, 'rows_per_second': self.size / seconds, 'bytes': len(data)}
+
+    def search(self):
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        samples = []
+        for _ in range(self.args.repeat):
+            for term in SEARCH_TERMS:
+                started = time.perf_counter()
+                self.get('/manage_participants', query_string={'search': term}, headers=headers)
+                samples.append(time.perf_counter() - started)
+
+            # the second page of a type filter, as "Load more" asks for it
+            first_page = self.get('/manage_participants', query_string={'type': 'Delegate'}, headers=headers)
+            cursor = first_page.get_json()['next_cursor'] or {}
+            started = time.perf_counter()
+            self.get('/manage_participants', query_string={'type': 'Delegate', **cursor}, headers=headers)
+            samples.append(time.perf_counter() - started)
+        return latency_result(samples)
+
+    def dashboard(self):
+        samples = []
+        for _ in range(self.args.repeat):
+            started = time.perf_counter()
+            self.get('/dashboard')
+            samples.append(time.perf_counter() - started)
+        return latency_result(samples)
+
+    def message_counts(self, message_id):
+        with self.app.app_context():
+            return dict(db.session.execute(
+                db.select(MessageRecipient.status, db.func.count(MessageRecipient.id))
+                .where(MessageRecipient.message_id == message_id)
+                .group_by(MessageRecipient.status)
+            ).all())
+
+    def latest_message_id(self):
+        with self.app.app_context():
+            return db.session.execute(db.select(db.func.max(Message.id))).scalar()
+
+    def blast(self):
+        worker = self.app.extensions['outbox_worker']
+        started = time.perf_counter()
+        response = self.client.post(
+            '/send_message',
+            json={'message': 'Hi {first_name}, opening ceremony starts at 9.', 'recipient_types': ['Delegate', 'Advisor', 'Staff', 'Secretariat']}
+        )
+        assert response.status_code == 200, response.get_json()
+        queued = time.perf_counter()
+        with self.app.app_context():
+            while worker.run_once():
+                pass
+        seconds = time.perf_counter() - started
+
+        counts = self.message_counts(self.latest_message_id())
+        assert counts.get('sent', 0) + counts.get('failed', 0) == self.size, counts
+        return {
+            'seconds': seconds,
+            'enqueue_seconds': queued - started,
+            'messages_per_second': self.size / seconds,
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+        }
+
+    def scheduled_send(self):
+        scheduler = self.app.extensions['message_scheduler']
+        scheduler.start()
+        try:
+            started = time.perf_counter()
+            # the form has minute precision; the current minute is already due
+            response = self.client.post('/send_message', json={
+                'message': 'Reminder {first_name}: committee sessions resume at 2pm.',
+                'recipient_types': ['Delegate', 'Advisor', 'Staff', 'Secretariat'],
+                'scheduled_at': datetime.now().strftime('%Y-%m-%d %H:%M')
+            })
+            assert response.status_code == 200, response.get_json()
+            message_id = self.latest_message_id()
+
+            with self.app.app_context():
+                while True:
+                    status = db.session.execute(db.select(Message.status).where(Message.id == message_id)).scalar()
+                    db.session.rollback()
+                    if status in ('sent', 'error'):
+                        break
+                    time.sleep(0.02)
+            seconds = time.perf_counter() - started
+        finally:
+            scheduler.stop()
+
+        counts = self.message_counts(message_id)
+        assert status == 'sent', status
+        return {
+            'seconds': seconds,
+            'messages_per_second': self.size / seconds,
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+        }
+
+
+BENCHMARKS = ['csv_upload', 'search', 'dashboard', 'blast', 'scheduled_send']
+
+
+def database_url(name):
+    if name == 'sqlite':
+        return 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+    return name.replace('postgres://', 'postgresql://', 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Benchmarks at least `tolerance` slower than in the baseline file, as printable lines."""
+    with open(baseline_path) as f:
+        baseline = {
+            (r['database'], r['participants'], r['benchmark']): r['seconds'] for r in json.load(f)['results']
+        }
+
+    regressions = []
+    for r in results:
+        before = baseline.get((r['database'], r['participants'], r['benchmark']))
+        if before and r['seconds'] > before * (1 + tolerance):
+            regressions.append(
+                f"{r['benchmark']} on {r['database']} at {r['participants']}: "
+                f"{before:.4f}s -> {r['seconds']:.4f}s (+{(r['seconds'] / before - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--database', action='append', help='"sqlite" or a SQLAlchemy URL; repeatable (default: sqlite)')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='run only these benchmarks (csv_upload always runs, to seed)')
+    parser.add_argument('--repeat', type=int, default=20, help='passes over the search terms and dashboard renders')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake provider seconds per send')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fake provider failure rate')
+    parser.add_argument('--concurrency', type=int, default=100, help='SMS_DISPATCH_CONCURRENCY')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/e2e-<timestamp>.json)')
+    parser.add_argument('--compare', help='an earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown that counts as a regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    selected = [name for name in BENCHMARKS if not args.only or name in args.only or name == 'csv_upload']
+    started_at = datetime.now()
+    results = []
+
+    for database in args.database or ['sqlite']:
+        url = database_url(database)
+        for size in args.sizes:
+            run = Run(url, size, args)
+            for name in selected:
+                result = getattr(run, name)()
+                results.append({'database': run.dialect, 'participants': size, 'benchmark': name, **result})
+                extra = ', '.join(
+                    f'{key}={value:.4f}' if key.endswith('seconds') else
+                    f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}'
+                    for key, value in result.items() if key != 'seconds'
+                )
+                print(f'{run.dialect:<10} {size:>7} {name:<15} {result["seconds"]:>9.4f}s  {extra}', flush=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f'e2e-{started_at:%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {
+                'latency': args.latency,
+                'error_rate': args.error_rate,
+                'concurrency': args.concurrency,
+                'repeat': args.repeat,
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
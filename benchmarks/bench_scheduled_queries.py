@@ -0,0 +1,120 @@
+"""Count the SQL statements a scheduled send issues for growing audiences.
+
+Schedules one message per audience size, sends each through
+send_scheduled_message with the in-process fake SMS provider (no network),
+and counts the statements executed. The count should only grow by one query
+per SCHEDULER_RECIPIENT_CHUNK_SIZE recipients (1000 by default); the pre-fix
+loop is run alongside for comparison and grows by one query per recipient.
+
+Uses DATABASE_URL when set (e.g. a scratch local Postgres), otherwise a
+throwaway SQLite file. Never point it at a real database: it creates and
+drops tables.
+
+    python benchmarks/bench_scheduled_queries.py [size ...]
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'scheduled.db')
+
+from sqlalchemy import event
+from app import create_app
+from extensions import db
+from models import Admin, Conference, Participant, Message, MessageRecipient
+from routes import send_scheduled_message, send_messages_now
+
+
+class BenchConfig:
+    SMS_PROVIDER = 'fake'
+    SMS_FAKE_LATENCY = 0
+    SMS_SENDER_RATE = 1e9
+    SMS_SENDER_BURST = 1000000
+    # one ledger write per send, so the count only reflects how recipients are loaded
+    DELIVERY_FLUSH_SIZE = 10 ** 9
+    DELIVERY_FLUSH_INTERVAL = float('inf')
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def legacy_send(message):
+    """The scheduler's per-message loop before recipients were loaded in one query."""
+    recipient_entries = MessageRecipient.query.filter_by(message_id=message.id).all()
+    recipients = [(entry.participant, entry.id, entry.attempts) for entry in recipient_entries]
+    return send_messages_now(message, [recipients])
+
+
+def schedule(admin_id, participant_ids):
+    message = Message(
+        content='Hello {first_name}',
+        sent_by=admin_id,
+        status='scheduled',
+        scheduled_at=datetime.now(),
+        recipient_count=len(participant_ids)
+    )
+    db.session.add(message)
+    db.session.flush()
+    db.session.execute(db.insert(MessageRecipient), [
+        {'message_id': message.id, 'participant_id': participant_id, 'status': 'pending'}
+        for participant_id in participant_ids
+    ])
+    db.session.commit()
+    return message.id
+
+
+def measure(counter, send, message_id):
+    # start every run from an empty identity map, as the scheduler thread does
+    db.session.expunge_all()
+    message = db.session.get(Message, message_id)
+    before = counter.count
+    counts = send(message)
+    return counter.count - before, counts
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10, 100, 1000, 2000]
+    app = create_app(BenchConfig)
+    app.logger.setLevel('WARNING')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Conference.init_default_conferences()
+        admin = Admin(username='bench', conference_id=1)
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.execute(db.insert(Participant), [
+            {
+                'conference_id': 1,
+                'first_name': f'First{i}',
+                'last_name': f'Last{i}',
+                'phone': f'+1206{i:07d}',
+                'participant_type': 'Delegate'
+            }
+            for i in range(max(sizes))
+        ])
+        db.session.commit()
+        admin_id = admin.id
+        participant_ids = db.session.execute(db.select(Participant.id).order_by(Participant.id)).scalars().all()
+
+        counter = QueryCounter(db.engine)
+        print(f'{"recipients":>10} {"queries":>8} {"legacy queries":>15}')
+        for size in sizes:
+            queries, counts = measure(counter, send_scheduled_message, schedule(admin_id, participant_ids[:size]))
+            legacy_queries, _ = measure(counter, legacy_send, schedule(admin_id, participant_ids[:size]))
+            assert counts['sent'] == size, counts
+            print(f'{size:>10} {queries:>8} {legacy_queries:>15}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Print query plans for each route's hot queries with and without the indexes.
+
+Seeds a database with 100k participants (plus messages and recipients),
+drops the indexes added in migration 1e3e09316b18, prints EXPLAIN output for
+every query, recreates the indexes and prints the plans again.
+
+Uses DATABASE_URL when set (e.g. a scratch local Postgres), otherwise a
+throwaway SQLite file. Never point it at a real database: it creates and
+drops tables.
+
+    python benchmarks/explain_queries.py [participants]
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'explain.db')
+
+from sqlalchemy import text
+from app import create_app
+from extensions import db
+from models import Admin, Conference, Participant, Message, MessageRecipient
+
+
+QUERIES = [
+    ('upload_participants: phone map',
+     "SELECT phone, id FROM participant WHERE conference_id = 1"),
+    ('upload_participants: single phone lookup',
+     "SELECT id FROM participant WHERE conference_id = 1 AND phone = '+12060000042'"),
+    ('dashboard: participant count',
+     "SELECT count(*) FROM participant WHERE conference_id = 1 AND participant_type = 'Delegate'"),
+    ('dashboard: recent messages',
+     "SELECT id FROM message WHERE sent_by = 1 AND status = 'sent' ORDER BY sent_at DESC LIMIT 5"),
+    ('dashboard: scheduled messages',
+     "SELECT id FROM message WHERE sent_by = 1 AND status = 'scheduled' ORDER BY scheduled_at"),
+    ('scheduler: due messages',
+     "SELECT id FROM message WHERE status = 'scheduled' AND scheduled_at <= '2030-01-01 00:00:00'"),
+    ('scheduler: recipients of a message',
+     "SELECT participant_id FROM message_recipient WHERE message_id = 7"),
+    ('outbox: outstanding recipients of a message',
+     "SELECT count(id) FROM message_recipient WHERE message_id = 7 AND status IN ('pending', 'sending')"),
+    ('clear participants: recipient rows',
+     "SELECT id FROM message_recipient WHERE participant_id IN (SELECT id FROM participant WHERE conference_id = 1)"),
+]
+
+
+def seed(participant_count):
+    Conference.init_default_conferences()
+    admin = Admin(username='explain', conference_id=1)
+    admin.set_password('explain')
+    db.session.add(admin)
+    db.session.flush()
+
+    types = ['Delegate', 'Delegate', 'Delegate', 'Advisor', 'Staff', 'Secretariat']
+    db.session.execute(db.insert(Participant), [
+        {
+            'conference_id': i % 4 + 1,
+            'first_name': f'First{i}',
+            'last_name': f'Last{i % 5000}',
+            'phone': f'+1206{i:07d}',
+            'participant_type': types[i % len(types)]
+        }
+        for i in range(participant_count)
+    ])
+
+    now = datetime.now()
+    db.session.execute(db.insert(Message), [
+        {
+            'content': f'Message {i}',
+            'sent_by': admin.id,
+            'status': 'scheduled' if i % 10 == 0 else 'sent',
+            'sent_at': now - timedelta(minutes=i),
+            'scheduled_at': now + timedelta(minutes=i) if i % 10 == 0 else None,
+            'recipient_count': 500
+        }
+        for i in range(500)
+    ])
+    db.session.execute(db.insert(MessageRecipient), [
+        {'message_id': i // 500 + 1, 'participant_id': i % participant_count + 1, 'status': 'sent'}
+        for i in range(min(participant_count, 250000))
+    ])
+    db.session.commit()
+
+
+def explain_all(label):
+    explain = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    print(f'\n==================== {label} ====================')
+    for name, sql in QUERIES:
+        print(f'\n-- {name}\n   {sql}')
+        for row in db.session.execute(text(explain + sql)):
+            print('   ', ' | '.join(str(column) for column in row))
+
+
+def hot_query_indexes():
+    return [
+        index for model in (Participant, Message, MessageRecipient)
+        for index in model.__table__.indexes
+    ]
+
+
+def main():
+    participant_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    app = create_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f'Seeding {participant_count} participants into {db.engine.url.render_as_string()}')
+        seed(participant_count)
+
+        # SQLite can't drop a unique constraint without rebuilding the table, so
+        # there the "before" plans still have the (conference_id, phone) index
+        postgres = db.engine.dialect.name == 'postgresql'
+        with db.engine.begin() as connection:
+            for index in hot_query_indexes():
+                index.drop(connection)
+            if postgres:
+                connection.execute(text('ALTER TABLE participant DROP CONSTRAINT uq_participant_conference_phone'))
+        db.session.execute(text('ANALYZE'))
+        explain_all('before: no secondary indexes')
+
+        with db.engine.begin() as connection:
+            for index in hot_query_indexes():
+                index.create(connection)
+            if postgres:
+                connection.execute(text(
+                    'ALTER TABLE participant ADD CONSTRAINT uq_participant_conference_phone UNIQUE (conference_id, phone)'
+                ))
+        db.session.execute(text('ANALYZE'))
+        explain_all('after: migration 1e3e09316b18 indexes')
+
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
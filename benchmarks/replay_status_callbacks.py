@@ -0,0 +1,104 @@
+"""Replay delivery-status callbacks against a running app.
+
+Posts recorded Twilio status callback payloads to the /sms/status endpoint as
+fast as the concurrency allows and reports throughput. Payloads come from a
+JSON-lines file, one dict of form fields per line (set
+SMS_STATUS_CALLBACK_RECORD_PATH on a running app to record real ones), or are
+generated for every recipient row with a provider SID in the app database
+with --from-db: a 'sent' and then a final 'delivered' or 'undelivered'
+receipt per SID, shuffled so some arrive out of order.
+
+Requests are signed with TWILIO_AUTH_TOKEN when it is set, so signature
+validation can stay on. Point the app's SMS_STATUS_CALLBACK_URL at the same
+URL you replay to, or the signatures won't match.
+
+    python benchmarks/replay_status_callbacks.py http://localhost:8000/sms/status payloads.jsonl
+    python benchmarks/replay_status_callbacks.py http://localhost:8000/sms/status --from-db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import aiohttp
+from twilio.request_validator import RequestValidator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def load_payloads(path):
+    with open(path) as payload_file:
+        return [json.loads(line) for line in payload_file if line.strip()]
+
+
+def payloads_from_db(undelivered_rate):
+    from app import create_app
+    from extensions import db
+    from models import MessageRecipient
+
+    app = create_app()
+    with app.app_context():
+        sids = db.session.execute(
+            db.select(MessageRecipient.provider_sid).where(MessageRecipient.provider_sid.isnot(None))
+        ).scalars().all()
+
+    payloads = []
+    for sid in sids:
+        payloads.append({'MessageSid': sid, 'MessageStatus': 'sent'})
+        if random.random() < undelivered_rate:
+            payloads.append({'MessageSid': sid, 'MessageStatus': 'undelivered', 'ErrorCode': '30003'})
+        else:
+            payloads.append({'MessageSid': sid, 'MessageStatus': 'delivered'})
+    random.shuffle(payloads)
+    return payloads
+
+
+async def replay(url, payloads, concurrency, auth_token):
+    validator = RequestValidator(auth_token) if auth_token else None
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    statuses = {}
+
+    async def worker(session):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            headers = {'X-Twilio-Signature': validator.compute_signature(url, payload)} if validator else {}
+            try:
+                async with session.post(url, data=payload, headers=headers) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('payloads', nargs='?', help='JSON-lines file of recorded callback payloads')
+    parser.add_argument('--from-db', action='store_true', help='generate receipts for every sent recipient in the database')
+    parser.add_argument('--undelivered-rate', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.from_db:
+        payloads = payloads_from_db(args.undelivered_rate)
+    elif args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        parser.error('give a payloads file or --from-db')
+
+    started = time.perf_counter()
+    statuses = asyncio.run(replay(args.url, payloads, args.concurrency, os.environ.get('TWILIO_AUTH_TOKEN')))
+    elapsed = time.perf_counter() - started
+    print(f'{len(payloads)} callbacks in {elapsed:.2f}s ({len(payloads) / elapsed:.0f}/s), responses: {statuses}')
+
+
+if __name__ == '__main__':
+    main()
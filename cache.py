@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import namedtuple
+from extensions import db
+from models import Conference
+
+
+class ProcessCache:
+    """Small thread-safe cache local to one app process.
+
+    Entries expire after `ttl` seconds so changes made by other processes
+    (other gunicorn workers, background jobs) show up eventually; changes made
+    in this process should invalidate or update the entry right away.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def update(self, key, updater):
+        """Apply `updater` to a cached value in place; does nothing if the key isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                updater(entry[1])
+
+    def invalidate(self, key=None):
+        """Drop one entry, or everything when no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# conference id -> {'delegates': n, 'advisors': n, 'staff': n, 'secretariat': n}
+participant_count_cache = ProcessCache(ttl=30)
+
+# display metadata for every conference; only changes when conferences are seeded
+ConferenceInfo = namedtuple('ConferenceInfo', ['id', 'name', 'theme_color', 'logo_path'])
+conference_cache = ProcessCache(ttl=float('inf'))
+
+
+def get_conferences():
+    """All conferences by id, loaded with one query per process until invalidated."""
+    def load():
+        rows = db.session.execute(
+            db.select(Conference.id, Conference.name, Conference.theme_color, Conference.logo_path)
+            .order_by(Conference.id)
+        ).all()
+        return {row.id: ConferenceInfo(*row) for row in rows}
+
+    return conference_cache.get_or_load('all', load)
+
+
+def get_conference(conference_id):
+    if not conference_id:
+        return None
+    return get_conferences().get(int(conference_id))
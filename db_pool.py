@@ -0,0 +1,94 @@
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+import metrics
+
+# Connection pool settings per deployment. Every app process has its own pool,
+# so a process can hold up to pool_size + max_overflow connections; keep
+# processes * (pool_size + max_overflow) under the database's connection limit.
+POOL_PROFILES = {
+    # SQLAlchemy's own defaults
+    'default': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': -1, 'pool_pre_ping': False},
+    # managed Postgres plans with a low connection limit and idle connections cut by the provider
+    'small': {'pool_size': 2, 'max_overflow': 3, 'pool_timeout': 10, 'pool_recycle': 300, 'pool_pre_ping': True},
+    'large': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    # behind PgBouncer in transaction mode: PgBouncer does the pooling, and a server
+    # connection only belongs to us for one transaction, so nothing is kept open here
+    'pgbouncer': {'pool_pre_ping': False},
+}
+
+# config keys that override a single setting of the selected profile
+POOL_OVERRIDES = {
+    'DB_POOL_SIZE': ('pool_size', int),
+    'DB_MAX_OVERFLOW': ('max_overflow', int),
+    'DB_POOL_TIMEOUT': ('pool_timeout', int),
+    'DB_POOL_RECYCLE': ('pool_recycle', int),
+    'DB_POOL_PRE_PING': ('pool_pre_ping', lambda value: str(value).lower() in ('1', 'true', 'yes')),
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.db_pool_timeouts.inc()
+            raise
+        finally:
+            metrics.db_pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def engine_options(config) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured DB_POOL_PROFILE and overrides.
+
+    SQLite databases keep Flask-SQLAlchemy's defaults; the profiles are for
+    database servers.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    profile_name = config.get('DB_POOL_PROFILE') or 'default'
+    if profile_name not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE {profile_name!r}; choose one of {', '.join(POOL_PROFILES)}")
+    options = dict(POOL_PROFILES[profile_name])
+
+    for key, (option, convert) in POOL_OVERRIDES.items():
+        if config.get(key) not in (None, ''):
+            options[option] = convert(config[key])
+
+    if profile_name == 'pgbouncer':
+        options['poolclass'] = NullPool
+        for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(option, None)
+        if url.get_driver_name() == 'psycopg':
+            # psycopg 3 prepares repeated statements per server connection, which PgBouncer may swap between transactions
+            options['connect_args'] = {'prepare_threshold': None}
+    else:
+        options['poolclass'] = InstrumentedQueuePool
+
+    return options
+
+
+def init_pool_metrics(app):
+    """Report the app's pool size, checked-out connections and saturation on /metrics."""
+    from extensions import db
+
+    with app.app_context():
+        engine = db.engine
+
+    def pool_stat(read):
+        # engine.pool is replaced when the engine is disposed, so look it up at scrape time
+        pool = engine.pool
+        return read(pool) if isinstance(pool, QueuePool) else None
+
+    metrics.db_pool_size.set_function(lambda: pool_stat(lambda pool: pool.size()))
+    metrics.db_pool_checked_out.set_function(lambda: pool_stat(lambda pool: pool.checkedout()))
+    metrics.db_pool_overflow.set_function(lambda: pool_stat(lambda pool: max(pool.overflow(), 0)))
+    metrics.db_pool_saturation.set_function(lambda: pool_stat(
+        lambda pool: pool.checkedout() / max(pool.size() + max(pool._max_overflow, 0), 1)
+    ))
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import metrics
+
+_local = threading.local()
+
+
+def thread_event_loop():
+    """This thread's event loop, kept between blasts.
+
+    Provider connections opened on it stay usable for the thread's next blast;
+    a fresh loop per blast would strand them.
+    """
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop
+
+
+class SmsDispatcher:
+    """Send a batch of SMS concurrently through an `SmsProvider`.
+
+    Each job is a dict with `participant_id`, `to` and `body`. Results come back
+    in the same order as the jobs, one dict per job: the provider's result (see
+    `SmsProvider`) plus the `participant_id` it belongs to.
+    """
+
+    def __init__(self, provider, sender_pool, concurrency=100, max_throttle_retries=3):
+        self.provider = provider
+        self.sender_pool = sender_pool
+        self.max_throttle_retries = max_throttle_retries
+        self.concurrency = max(1, int(concurrency))
+
+    def send_all(self, jobs, on_result=None):
+        """Blocking entry point, safe to call from request handlers and scheduler threads.
+
+        `on_result`, if given, is called with each result as soon as that send
+        finishes, on the calling thread. If it raises, no further send starts:
+        sends already under way finish and are still reported, jobs still
+        waiting give their rate limit tokens back, and the first error is
+        raised once the rest have settled.
+        """
+        if not jobs:
+            return []
+        metrics.sms_blast_size.inc(len(jobs))
+        with metrics.sms_blast_duration.time():
+            return thread_event_loop().run_until_complete(self._send_all(jobs, on_result))
+
+    async def _send_all(self, jobs, on_result):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = []  # raised by on_result; once there is one, jobs that haven't started are called off
+        async with self.provider.open_session(self.concurrency) as session:
+            tasks = [
+                asyncio.ensure_future(self._send_one(session, semaphore, job, on_result, errors)) for job in jobs
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                # only left running if the blast itself was cancelled; on this thread's
+                # long-lived loop they would resume during the next blast
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if errors:
+            raise errors[0]
+        return results
+
+    async def _send_one(self, session, semaphore, job, on_result=None, errors=()):
+        sender = self.sender_pool.sender_for(job['to'])
+        for attempt in range(self.max_throttle_retries + 1):
+            # wait for the sender's rate limit before taking a concurrency slot
+            await sender.bucket.acquire()
+            try:
+                await semaphore.acquire()
+            except asyncio.CancelledError:
+                sender.bucket.refund()
+                raise
+            try:
+                if errors:
+                    # the blast failed while this job waited; it stays unsent and its token goes back
+                    sender.bucket.refund()
+                    return None
+                started = time.perf_counter()
+                try:
+                    result = await self.provider.send_async(session, sender, job['to'], job['body'])
+                except Exception as e:
+                    # the request may have reached the provider, so this one isn't retried
+                    result = {'status': 'failed', 'error': str(e) or type(e).__name__}
+                metrics.sms_send_duration.observe(time.perf_counter() - started, provider=self.provider.name)
+            finally:
+                semaphore.release()
+            metrics.sms_sends.inc(provider=self.provider.name, status=result['status'])
+            if result['status'] != 'throttled':
+                break
+            # provider throttled this number: back the whole sender off, then retry
+            sender.bucket.penalize(result['retry_after'])
+
+        if result['status'] == 'throttled':
+            result = {'status': 'failed', 'error': result['error'], 'retryable': True}
+        if result['status'] == 'failed':
+            metrics.sms_failures.inc(error_code=result.get('error_code') or '')
+        result = {'participant_id': job['participant_id'], **result}
+        if on_result:
+            try:
+                on_result(result)
+            except Exception as e:
+                errors.append(e)
+        return result
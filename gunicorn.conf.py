@@ -0,0 +1,23 @@
+# Gunicorn settings for the web process: `gunicorn -c gunicorn.conf.py "app:create_app()"`
+import os
+
+
+def on_starting(server):
+    # metrics files left by the previous run's workers would be merged into this run's
+    if os.environ.get('METRICS_DIR'):
+        from metrics import clear_multiprocess_dir
+        clear_multiprocess_dir(os.environ['METRICS_DIR'])
+
+
+def post_worker_init(worker):
+    # each worker process runs its own scheduler (and outbox worker, if embedded);
+    # started after the fork so the threads live in the worker, not the arbiter
+    from app import start_background_workers
+    start_background_workers(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # a worker that was killed never dropped its gauges from METRICS_DIR itself
+    if os.environ.get('METRICS_DIR'):
+        from metrics import mark_process_dead
+        mark_process_dead(os.environ['METRICS_DIR'], worker.pid)
@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from extensions import db
+from models import Message, MessageRecipient
+from retries import RetryPolicy
+
+
+class DeliveryLedger:
+    """Write delivery outcomes back onto a message's MessageRecipient rows.
+
+    The `pending` rows written by `send_message` are the ledger: every send
+    updates its own row (status, sent_at, provider_sid, error_message,
+    attempts) instead of adding another one. A failure the retry policy allows
+    to be tried again leaves the row `retrying` with a `next_attempt_at` for
+    the outbox worker; anything else ends as `failed`.
+
+    Outcomes are buffered and written with a single executemany UPDATE every
+    `flush_size` results or `flush_interval` seconds, whichever comes first.
+    The writes happen on a writer thread with its own app context, so
+    `record()` never holds up the dispatcher's event loop on the database;
+    call `flush()` after the last result to write the rest and wait for them.
+    The same commit adds the final outcomes it wrote to the message's sent and
+    failed counters.
+
+    An outcome is only written to a row still waiting for it: a `pending` row,
+    or with `claimed_by` a row still `sending` under that outbox worker's
+    claim, so a worker whose lease was taken over can't overwrite the new
+    owner's outcome.
+    """
+
+    # the MessageRecipient columns an outcome writes
+    COLUMNS = ('status', 'sent_at', 'provider_sid', 'error_message', 'next_attempt_at', 'attempts')
+
+    def __init__(self, message_id, recipients, retry_policy=None, flush_size=500, flush_interval=0.5,
+                 claimed_by=None):
+        self.message_id = message_id
+        self.recipients = recipients  # participant id -> (MessageRecipient id, attempts so far)
+        self.claimed_by = claimed_by
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.sent = 0
+        self.failed = 0
+        self.retrying = 0
+        self._pending_updates = []
+        self._last_flush = time.monotonic()
+        self._writes = queue.Queue()  # batches handed to the writer thread, then None to stop it
+        self._writer = None
+        self._write_error = None
+        self._unwritten = []  # batches the writer failed to commit
+
+    def record(self, result):
+        """Buffer one dispatcher result, flushing if the batch is full or old enough."""
+        recipient_id, attempts = self.recipients.get(result['participant_id'], (None, 0))
+        attempts += 1
+
+        if result['status'] == 'sent':
+            self.sent += 1
+            values = {
+                'status': 'sent', 'sent_at': datetime.now(), 'provider_sid': result.get('sid'),
+                'error_message': None, 'next_attempt_at': None
+            }
+        else:
+            next_attempt_at = self.retry_policy.next_attempt_at(result, attempts)
+            if next_attempt_at:
+                self.retrying += 1
+            else:
+                self.failed += 1
+            values = {
+                'status': 'retrying' if next_attempt_at else 'failed', 'sent_at': None, 'provider_sid': None,
+                'error_message': result.get('error'), 'next_attempt_at': next_attempt_at
+            }
+
+        if recipient_id is not None:
+            # executemany parameters can't share a name with the columns they set
+            self._pending_updates.append({
+                'recipient_id': recipient_id, 'new_attempts': attempts,
+                **{f'new_{column}': value for column, value in values.items()}
+            })
+
+        if len(self._pending_updates) >= self.flush_size or \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self._hand_off()
+
+    def flush(self):
+        """Write every outcome recorded so far and wait until it is committed.
+
+        Raises the first error the writer thread ran into; the batches it could
+        not write are kept for `salvage()`.
+        """
+        self._hand_off()
+        self._stop_writer()
+        if self._write_error is not None:
+            error, self._write_error = self._write_error, None
+            raise error
+
+    def _hand_off(self):
+        # record() runs on the dispatcher's event loop, so the database work is left to a writer thread
+        if self._pending_updates:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, args=(current_app._get_current_object(),),
+                    name=f'ledger-{self.message_id}', daemon=True
+                )
+                self._writer.start()
+            self._writes.put(self._pending_updates)
+            self._pending_updates = []
+        self._last_flush = time.monotonic()
+
+    def _stop_writer(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self, app):
+        with app.app_context():
+            while (updates := self._writes.get()) is not None:
+                try:
+                    self._write(updates)
+                except Exception as e:
+                    db.session.rollback()
+                    self._unwritten.append(updates)
+                    if self._write_error is None:
+                        self._write_error = e
+
+    def _write(self, updates):
+        by_status = {}
+        for update in updates:
+            by_status.setdefault(update['new_status'], []).append(update)
+        # only rows this UPDATE actually moved to their outcome are counted, so a row
+        # already written by someone else can't be counted twice
+        changed = {
+            status: db.session.execute(self._update_statement(), params).rowcount
+            for status, params in by_status.items()
+        }
+        sent = changed.get('sent', 0)
+        failed = changed.get('failed', 0)
+        if sent or failed:
+            db.session.execute(
+                db.update(Message).where(Message.id == self.message_id).values(
+                    sent_count=Message.sent_count + sent,
+                    failed_count=Message.failed_count + failed
+                )
+            )
+        db.session.commit()
+
+    def _update_statement(self):
+        recipient = MessageRecipient.__table__
+        if self.claimed_by is None:
+            waiting = recipient.c.status == 'pending'
+        else:
+            waiting = db.and_(recipient.c.status == 'sending', recipient.c.claimed_by == self.claimed_by)
+        return recipient.update().where(recipient.c.id == db.bindparam('recipient_id'), waiting).values(
+            {column: db.bindparam(f'new_{column}') for column in self.COLUMNS}
+        )
+
+    def salvage(self):
+        """Write the outcomes still buffered when a blast fails part-way.
+
+        Rolls back whatever the failure left in the session and flushes in a
+        fresh transaction, so recipients whose text already went out are not
+        left `pending` and sent it again. Returns False if that fails too.
+        """
+        db.session.rollback()
+        self._stop_writer()
+        self._write_error = None
+        self._unwritten.append(self._pending_updates)
+        self._pending_updates = []
+        try:
+            while self._unwritten:
+                self._write(self._unwritten[0])
+                self._unwritten.pop(0)
+        except Exception:
+            db.session.rollback()
+            return False
+        return True
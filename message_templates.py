@@ -0,0 +1,93 @@
+from functools import lru_cache
+from string import Formatter
+
+# participant attributes a message body may refer to, e.g. "Hi {first_name}"
+PLACEHOLDERS = ('first_name', 'last_name', 'phone', 'participant_type')
+
+_formatter = Formatter()
+
+
+class TemplateError(ValueError):
+    """The message body isn't a valid template; the message says why."""
+
+
+class MessageTemplate:
+    """A message body parsed once and rendered for many participants.
+
+    Rendering follows str.format semantics for the fields in PLACEHOLDERS
+    (format specs and conversions included) without re-parsing the body for
+    every recipient. A body without placeholders is rendered once and the same
+    string is shared by every recipient.
+    """
+
+    def __init__(self, content:str):
+        self.content = content
+        self.parts = []  # literal strings and (field, conversion, format_spec) tuples, in order
+        fields = []
+        try:
+            parsed = list(_formatter.parse(content))
+        except ValueError as e:
+            raise TemplateError(f"{str(e)[0].upper()}{str(e)[1:]}. Write {{{{ or }}}} for a literal brace.")
+
+        for literal, field, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if field not in PLACEHOLDERS:
+                allowed = ', '.join('{' + name + '}' for name in PLACEHOLDERS)
+                raise TemplateError(f"Unknown placeholder {{{field}}}. Available placeholders: {allowed}.")
+            if conversion not in (None, 's', 'r', 'a'):
+                raise TemplateError(f"Unknown conversion !{conversion} in {{{field}}}.")
+            if format_spec and '{' in format_spec:
+                raise TemplateError(f"Nested placeholders are not supported in {{{field}}}.")
+            try:
+                format('', format_spec)
+            except ValueError as e:
+                raise TemplateError(f"Invalid format in {{{field}}}: {str(e)}")
+            self.parts.append((field, conversion, format_spec))
+            if field not in fields:
+                fields.append(field)
+
+        self.fields = tuple(fields)
+        self.static = None if self.fields else ''.join(self.parts)
+
+    def render(self, participant) -> str:
+        if self.static is not None:
+            return self.static
+        return ''.join(
+            part if isinstance(part, str) else self._render_field(getattr(participant, part[0]), part)
+            for part in self.parts
+        )
+
+    def _render_field(self, value, part):
+        _, conversion, format_spec = part
+        if conversion:
+            value = _formatter.convert_field(value, conversion)
+        return format(value, format_spec) if format_spec else str(value)
+
+    def renderer(self):
+        """A render function for one blast.
+
+        Participants whose placeholder values are identical share one rendered
+        string instead of each getting an equal copy.
+        """
+        if self.static is not None:
+            return lambda participant: self.static
+
+        rendered = {}
+
+        def render(participant):
+            key = tuple(getattr(participant, field) for field in self.fields)
+            body = rendered.get(key)
+            if body is None:
+                body = rendered[key] = self.render(participant)
+            return body
+
+        return render
+
+
+@lru_cache(maxsize=256)
+def compile_template(content:str) -> MessageTemplate:
+    """Parse a message body, reusing the result for bodies seen before. Raises TemplateError."""
+    return MessageTemplate(content)
@@ -0,0 +1,417 @@
+import atexit
+import bisect
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics live in the memory of each app process. Recording one observation is
+# a dict lookup and a few additions under a lock, cheap enough to leave on in
+# production. A scrape reaches only one gunicorn worker, so with several
+# processes set METRICS_DIR: every process then writes its values to a file
+# there every few seconds, and /metrics merges the files of all of them.
+# Counters and histograms are summed (a dead process's file is kept, so they
+# never go backwards); gauges are summed, maxed or reported per pid, as each
+# one declares, and only for live processes.
+# A process without a web server, like `flask outbox-worker`, serves its own
+# metrics on METRICS_PORT instead.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_multiprocess_dir = None
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def collect(self):
+        """This process's values, label key -> value."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, collected):
+        """Combine the values collected in several processes, given as (pid, values) pairs."""
+        merged = {}
+        for _, values in collected:
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0) + value
+        return merged, self.labelnames
+
+    def render(self, values=None, labelnames=None):
+        if values is None:
+            values, labelnames = self.collect(), self.labelnames
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down.
+
+    `multiprocess_mode` says how the values of several processes are merged:
+    'sum', 'max', or 'all' to report each process's value with a `pid` label.
+    """
+    kind = 'gauge'
+    _function = None
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='all'):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Report whatever `function` returns at scrape time instead of a set value; None leaves it out."""
+        self._function = function
+
+    def collect(self):
+        if self._function is None:
+            return super().collect()
+        value = self._function()
+        return {} if value is None else {(): value}
+
+    def merge(self, collected):
+        if self.multiprocess_mode == 'all':
+            merged = {key + (str(pid),): value for pid, values in collected for key, value in values.items()}
+            return merged, self.labelnames + ('pid',)
+        if self.multiprocess_mode == 'sum':
+            return super().merge(collected)
+        merged = {}
+        for _, values in collected:
+            for key, value in values.items():
+                merged[key] = max(merged.get(key, value), value)
+        return merged, self.labelnames
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last slot is +Inf), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        with self._lock:
+            return {key: [list(state[0]), state[1], state[2]] for key, state in self._values.items()}
+
+    def merge(self, collected):
+        merged = {}
+        for _, values in collected:
+            for key, (bucket_counts, total, count) in values.items():
+                state = merged.setdefault(key, [[0] * len(bucket_counts), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], bucket_counts)]
+                state[1] += total
+                state[2] += count
+        return merged, self.labelnames
+
+    def render(self, values=None, labelnames=None):
+        if values is None:
+            values, labelnames = self.collect(), self.labelnames
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, (bucket_counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def init_metrics(app):
+    """Time every request, labelled by endpoint name so URL parameters don't multiply the series.
+
+    With METRICS_DIR set, also start sharing this process's metrics through that directory.
+    """
+    from flask import g, request
+
+    if app.config.get('METRICS_DIR'):
+        start_multiprocess(app.config['METRICS_DIR'], app.config.get('METRICS_WRITE_INTERVAL', 5))
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+
+def render_metrics():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    if _multiprocess_dir is None:
+        for metric in _registry:
+            lines.extend(metric.render())
+    else:
+        write_process_file()
+        collected = _read_process_files(_multiprocess_dir)
+        for metric in _registry:
+            values, labelnames = metric.merge(
+                [(pid, metrics[metric.name]) for pid, metrics in collected if metric.name in metrics]
+            )
+            lines.extend(metric.render(values, labelnames))
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(authorization, token):
+    """Whether an Authorization header carries the scrape token; with no token configured nobody is."""
+    return bool(token) and hmac.compare_digest(authorization or '', f'Bearer {token}')
+
+
+def serve(port, token):
+    """Serve /metrics on `port` from a daemon thread, for processes that don't run the web app."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                status, body = 404, 'Not found\n'
+            elif not authorized(self.headers.get('Authorization'), token):
+                status, body = 401, 'Unauthorized\n'
+            else:
+                status, body = 200, render_metrics()
+            data = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # one line per scrape would drown the worker's own log
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+def _process_file(directory, pid):
+    return os.path.join(directory, f'{pid}.json')
+
+
+def _write_json(path, data):
+    # write and rename, so a reader never sees half a file
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_process_files(directory):
+    """(pid, {metric name: {label key: value}}) for every process file in `directory`."""
+    collected = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # removed or replaced while we listed the directory
+        collected.append((data['pid'], {
+            name: {tuple(key): value for key, value in values} for name, values in data['metrics'].items()
+        }))
+    return collected
+
+
+def write_process_file(live=True):
+    """Write this process's values to its file in METRICS_DIR; without `live`, leave its gauges out."""
+    pid = os.getpid()
+    _write_json(_process_file(_multiprocess_dir, pid), {'pid': pid, 'metrics': {
+        metric.name: [[list(key), value] for key, value in metric.collect().items()]
+        for metric in _registry if live or metric.kind != 'gauge'
+    }})
+
+
+def start_multiprocess(directory, interval=5):
+    """Share this process's metrics with the other processes writing to `directory`."""
+    global _multiprocess_dir
+    if _multiprocess_dir is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _multiprocess_dir = directory
+
+    def write_periodically():
+        while True:
+            time.sleep(interval)
+            try:
+                write_process_file()
+            except Exception:
+                pass  # a full or missing directory must not take the process down; the next write retries
+
+    def start_writer():
+        threading.Thread(target=write_periodically, name='metrics-writer', daemon=True).start()
+
+    def after_fork():
+        # a forked child (e.g. under gunicorn --preload) starts from zero, since the parent's
+        # values are in the parent's file, and needs a writer thread of its own
+        for metric in _registry:
+            metric._lock = threading.Lock()
+            metric._values = {}
+        start_writer()
+
+    start_writer()
+    os.register_at_fork(after_in_child=after_fork)
+    # the last values stay counted after the process is gone, its gauges don't
+    atexit.register(write_process_file, live=False)
+
+
+def mark_process_dead(directory, pid):
+    """Drop the gauges of a process that died without cleaning up after itself, e.g. a killed gunicorn worker."""
+    path = _process_file(directory, pid)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    gauges = {metric.name for metric in _registry if metric.kind == 'gauge'}
+    data['metrics'] = {name: values for name, values in data['metrics'].items() if name not in gauges}
+    _write_json(path, data)
+
+
+def clear_multiprocess_dir(directory):
+    """Remove the files of a previous run, e.g. when gunicorn starts."""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+# --- SMS dispatch
+sms_send_duration = Histogram(
+    'sms_send_duration_seconds', 'Latency of one provider send request.', ['provider']
+)
+sms_sends = Counter(
+    'sms_sends_total', 'Provider send requests by outcome.', ['provider', 'status']
+)
+sms_failures = Counter(
+    'sms_failures_total', 'Failed sends by provider error code (empty when the provider gave none).', ['error_code']
+)
+sms_blast_duration = Histogram(
+    'sms_blast_duration_seconds', 'Wall time to dispatch one batch of messages.',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+sms_blast_size = Counter(
+    'sms_blast_messages_total', 'Messages handed to the dispatcher.'
+)
+sms_http_connections = Counter(
+    'sms_http_connections_total', 'Provider HTTP connections used for a request, newly created or reused.',
+    ['provider', 'outcome']
+)
+sms_http_connect_duration = Histogram(
+    'sms_http_connect_duration_seconds', 'Time to open a new provider connection (TCP and TLS).', ['provider']
+)
+
+# --- scheduler
+scheduler_lag = Histogram(
+    'scheduler_lag_seconds', 'Time between a message\'s scheduled_at and the start of its send.',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+
+# --- participant CSV imports
+csv_import_rows = Counter(
+    'csv_import_rows_total', 'Participant CSV rows processed by outcome.', ['outcome']
+)
+csv_import_rows_per_second = Gauge(
+    'csv_import_rows_per_second', 'Throughput of the most recently finished participant import.'
+)
+
+# --- database connection pool
+db_pool_checkout_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time to get a connection from the pool, including opening a new one.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+db_pool_timeouts = Counter(
+    'db_pool_timeouts_total', 'Checkouts that gave up after pool_timeout with every connection in use.'
+)
+db_pool_size = Gauge(
+    'db_pool_size', 'Connections the pool keeps open.', multiprocess_mode='sum'
+)
+db_pool_checked_out = Gauge(
+    'db_pool_checked_out', 'Connections currently in use.', multiprocess_mode='sum'
+)
+db_pool_overflow = Gauge(
+    'db_pool_overflow', 'Connections open beyond the pool size.', multiprocess_mode='sum'
+)
+db_pool_saturation = Gauge(
+    'db_pool_saturation', 'Connections in use as a fraction of pool_size + max_overflow, in the busiest process.',
+    multiprocess_mode='max'
+)
+
+# --- HTTP
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ['endpoint', 'method', 'status']
+)
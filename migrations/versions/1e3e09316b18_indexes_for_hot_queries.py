@@ -0,0 +1,67 @@
+"""Indexes for hot queries and unique participant phone per conference
+
+Revision ID: 1e3e09316b18
+Revises: 5064a3c6b0ec
+Create Date: 2026-10-17 21:20:52.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e3e09316b18'
+down_revision = '5064a3c6b0ec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Participants added by hand were never checked for duplicates. Keep the
+    # oldest row for each (conference_id, phone), point its message history
+    # at it and drop the rest so the unique constraint can be created.
+    op.execute("""
+        UPDATE message_recipient SET participant_id = (
+            SELECT MIN(keep.id) FROM participant dup
+            JOIN participant keep ON keep.conference_id = dup.conference_id AND keep.phone = dup.phone
+            WHERE dup.id = message_recipient.participant_id
+        )
+        WHERE participant_id IN (
+            SELECT dup.id FROM participant dup WHERE EXISTS (
+                SELECT 1 FROM participant keep
+                WHERE keep.conference_id = dup.conference_id AND keep.phone = dup.phone AND keep.id < dup.id
+            )
+        )
+    """)
+    op.execute("""
+        DELETE FROM participant WHERE EXISTS (
+            SELECT 1 FROM participant keep
+            WHERE keep.conference_id = participant.conference_id AND keep.phone = participant.phone AND keep.id < participant.id
+        )
+    """)
+
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_participant_conference_phone', ['conference_id', 'phone'])
+        batch_op.create_index('ix_participant_conference_type', ['conference_id', 'participant_type'], unique=False)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_status_scheduled_at', ['status', 'scheduled_at'], unique=False)
+        batch_op.create_index('ix_message_sent_by_status_sent_at', ['sent_by', 'status', 'sent_at'], unique=False)
+
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.create_index('ix_message_recipient_message_status', ['message_id', 'status'], unique=False)
+        batch_op.create_index('ix_message_recipient_participant_id', ['participant_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_recipient_participant_id')
+        batch_op.drop_index('ix_message_recipient_message_status')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_sent_by_status_sent_at')
+        batch_op.drop_index('ix_message_status_scheduled_at')
+
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.drop_index('ix_participant_conference_type')
+        batch_op.drop_constraint('uq_participant_conference_phone', type_='unique')
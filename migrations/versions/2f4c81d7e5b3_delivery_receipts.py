@@ -0,0 +1,30 @@
+"""Delivery receipt columns on message_recipient
+
+Revision ID: 2f4c81d7e5b3
+Revises: 6b0f3e2a91c4
+Create Date: 2026-10-17 21:24:10.553207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f4c81d7e5b3'
+down_revision = '6b0f3e2a91c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('delivery_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('delivered_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_message_recipient_provider_sid', ['provider_sid'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_recipient_provider_sid')
+        batch_op.drop_column('delivered_at')
+        batch_op.drop_column('delivery_status')
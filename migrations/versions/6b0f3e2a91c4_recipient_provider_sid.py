@@ -0,0 +1,26 @@
+"""Provider message id on message_recipient
+
+Revision ID: 6b0f3e2a91c4
+Revises: 958d58157a24
+Create Date: 2026-10-17 21:18:52.907114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b0f3e2a91c4'
+down_revision = '958d58157a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('provider_sid', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.drop_column('provider_sid')
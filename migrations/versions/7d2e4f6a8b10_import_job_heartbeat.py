@@ -0,0 +1,26 @@
+"""Heartbeat on import_job
+
+Revision ID: 7d2e4f6a8b10
+Revises: e5a1c9d4b7f3
+Create Date: 2026-10-17 22:31:54.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e4f6a8b10'
+down_revision = 'e5a1c9d4b7f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('import_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('import_job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,30 @@
+"""Retry state on message_recipient
+
+Revision ID: 8a3d5c0e7f12
+Revises: 2f4c81d7e5b3
+Create Date: 2026-10-17 21:31:45.180362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3d5c0e7f12'
+down_revision = '2f4c81d7e5b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_message_recipient_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_recipient_status_next_attempt_at')
+        batch_op.drop_column('next_attempt_at')
+        batch_op.drop_column('attempts')
@@ -0,0 +1,43 @@
+"""Delivery counters on message
+
+Revision ID: c47e1b9d2a60
+Revises: 8a3d5c0e7f12
+Create Date: 2026-10-17 21:42:08.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1b9d2a60'
+down_revision = '8a3d5c0e7f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sent_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('failed_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('delivered_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_message_sent_by_sent_at_id', ['sent_by', 'sent_at', 'id'], unique=False)
+
+    # count the outcomes of messages sent before the counters existed
+    op.execute("""
+        UPDATE message SET
+            sent_count = (SELECT COUNT(*) FROM message_recipient r
+                          WHERE r.message_id = message.id AND r.status = 'sent'),
+            failed_count = (SELECT COUNT(*) FROM message_recipient r
+                            WHERE r.message_id = message.id AND r.status = 'failed'),
+            delivered_count = (SELECT COUNT(*) FROM message_recipient r
+                               WHERE r.message_id = message.id AND r.delivery_status = 'delivered')
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_sent_by_sent_at_id')
+        batch_op.drop_column('delivered_count')
+        batch_op.drop_column('failed_count')
+        batch_op.drop_column('sent_count')
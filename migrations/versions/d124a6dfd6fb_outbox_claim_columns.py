@@ -0,0 +1,40 @@
+"""Outbox claim columns on message_recipient
+
+Revision ID: d124a6dfd6fb
+Revises: 97db1229c6f1
+Create Date: 2026-10-17 21:02:11.402513
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd124a6dfd6fb'
+down_revision = '97db1229c6f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_by', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+    # Before the outbox, sends were recorded as extra 'sent' rows and the 'pending'
+    # rows written up front were never updated, so every message sent so far still
+    # has them, and a blast that timed out is still a 'pending' message. The outbox
+    # would deliver all of those again; retire them. Scheduled messages keep theirs.
+    op.execute("""
+        UPDATE message_recipient SET status = 'superseded'
+        WHERE status = 'pending'
+          AND message_id IN (SELECT id FROM message WHERE status IS NULL OR status != 'scheduled')
+    """)
+    op.execute("UPDATE message SET status = 'failed' WHERE status = 'pending'")
+
+
+def downgrade():
+    # the superseded rows and failed messages are left as they are; the old code never reads them
+    with op.batch_alter_table('message_recipient', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('claimed_by')
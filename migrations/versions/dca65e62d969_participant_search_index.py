@@ -0,0 +1,58 @@
+"""Participant search index and keyset ordering index
+
+Revision ID: dca65e62d969
+Revises: 1e3e09316b18
+Create Date: 2026-10-17 21:41:07.520931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dca65e62d969'
+down_revision = '1e3e09316b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.create_index('ix_participant_conference_last_name_id', ['conference_id', 'last_name', 'id'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_participant_search_trgm ON participant "
+            "USING gin ((first_name || ' ' || last_name || ' ' || phone) gin_trgm_ops)"
+        )
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS participant_fts USING fts5(name, phone, tokenize='trigram')")
+        op.execute(
+            "INSERT INTO participant_fts(rowid, name, phone) "
+            "SELECT id, first_name || ' ' || last_name, phone FROM participant"
+        )
+        op.execute("""CREATE TRIGGER IF NOT EXISTS participant_fts_insert AFTER INSERT ON participant BEGIN
+            INSERT INTO participant_fts(rowid, name, phone) VALUES (new.id, new.first_name || ' ' || new.last_name, new.phone);
+        END""")
+        op.execute("""CREATE TRIGGER IF NOT EXISTS participant_fts_update AFTER UPDATE ON participant BEGIN
+            UPDATE participant_fts SET name = new.first_name || ' ' || new.last_name, phone = new.phone WHERE rowid = old.id;
+        END""")
+        op.execute("""CREATE TRIGGER IF NOT EXISTS participant_fts_delete AFTER DELETE ON participant BEGIN
+            DELETE FROM participant_fts WHERE rowid = old.id;
+        END""")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_participant_search_trgm")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS participant_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS participant_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS participant_fts_insert")
+        op.execute("DROP TABLE IF EXISTS participant_fts")
+
+    with op.batch_alter_table('participant', schema=None) as batch_op:
+        batch_op.drop_index('ix_participant_conference_last_name_id')
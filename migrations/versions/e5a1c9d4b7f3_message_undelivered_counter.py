@@ -0,0 +1,33 @@
+"""Undelivered counter on message
+
+Revision ID: e5a1c9d4b7f3
+Revises: c47e1b9d2a60
+Create Date: 2026-10-17 21:45:37.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c9d4b7f3'
+down_revision = 'c47e1b9d2a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('undelivered_count', sa.Integer(), server_default='0', nullable=False))
+
+    # count the failed delivery receipts of messages sent before the counter existed
+    op.execute("""
+        UPDATE message SET
+            undelivered_count = (SELECT COUNT(*) FROM message_recipient r
+                                 WHERE r.message_id = message.id AND r.delivery_status IN ('undelivered', 'failed'))
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('undelivered_count')
@@ -67,8 +67,9 @@ class Conference(db.Model):
             }
         ]
         
+        existing_names = set(db.session.execute(db.select(Conference.name)).scalars())
         for conf_data in conferences:
-            if not Conference.query.filter_by(name=conf_data['name']).first():
+            if conf_data['name'] not in existing_names:
                 conference = Conference(**conf_data)
                 db.session.add(conference)
         
@@ -86,22 +87,73 @@ class Participant(db.Model):
     # Relationships
     received_messages = db.relationship('MessageRecipient', backref='participant', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.UniqueConstraint('conference_id', 'phone', name='uq_participant_conference_phone'),
+        db.Index('ix_participant_conference_type', 'conference_id', 'participant_type'),
+        db.Index('ix_participant_conference_last_name_id', 'conference_id', 'last_name', 'id'),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     sent_by = db.Column(db.Integer, db.ForeignKey('admin.id'))
     sent_at = db.Column(db.DateTime, default=datetime.now)
     scheduled_at = db.Column(db.DateTime, nullable=True)  # NEW FIELD
-    status = db.Column(db.String(20), default='pending')  # pending, sent, failed, scheduled
+    status = db.Column(db.String(20), default='pending')  # pending, sent, failed, scheduled, sending
     recipient_count = db.Column(db.Integer)
+    claimed_by = db.Column(db.String(64))  # scheduler currently sending this scheduled message
+    claimed_at = db.Column(db.DateTime)
+    # recipient outcomes, kept up to date by the delivery ledger and receipt buffer as they are written
+    sent_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    failed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    delivered_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    undelivered_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     recipients = db.relationship('MessageRecipient', backref='message', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_message_status_scheduled_at', 'status', 'scheduled_at'),
+        db.Index('ix_message_sent_by_status_sent_at', 'sent_by', 'status', 'sent_at'),
+        db.Index('ix_message_sent_by_sent_at_id', 'sent_by', 'sent_at', 'id'),
+    )
+
 class MessageRecipient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False)
     participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, sent, failed
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, retrying, failed, superseded (pre-outbox)
     sent_at = db.Column(db.DateTime)
-    error_message = db.Column(db.Text)
\ No newline at end of file
+    error_message = db.Column(db.Text)
+    provider_sid = db.Column(db.String(64))  # provider's id for the sent SMS, e.g. Twilio's SM...
+    delivery_status = db.Column(db.String(20))  # latest provider receipt: queued, sent, delivered, undelivered, failed
+    delivered_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime)  # when a `retrying` row is due to be sent again
+    claimed_by = db.Column(db.String(64))  # outbox worker currently delivering this row
+    claimed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_message_recipient_message_status', 'message_id', 'status'),
+        db.Index('ix_message_recipient_participant_id', 'participant_id'),
+        db.Index('ix_message_recipient_provider_sid', 'provider_sid'),
+        db.Index('ix_message_recipient_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    conference_id = db.Column(db.Integer, db.ForeignKey('conference.id'), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('admin.id'))
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    total_bytes = db.Column(db.Integer, default=0)
+    bytes_processed = db.Column(db.Integer, default=0)
+    rows_processed = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    error_messages = db.Column(db.Text, default='')  # one per line
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # bumped while the import runs; silence means its process died
+    finished_at = db.Column(db.DateTime)
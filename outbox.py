@@ -0,0 +1,225 @@
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from extensions import db
+from models import Message, MessageRecipient
+import metrics
+
+
+class OutboxWorker:
+    """Deliver queued messages outside the request cycle.
+
+    `send_message` only writes `pending` MessageRecipient rows. A worker claims
+    a batch of those rows (marking them `sending` under its own id), delivers
+    them through the async dispatcher and writes the outcome back to the same
+    rows. Claims older than the lease are considered abandoned by a dead worker
+    and are picked up again, so a crash never leaves a blast half-sent.
+    Recipients left `retrying` by a failed send are claimed the same way once
+    their `next_attempt_at` has passed, whichever path sent the message first.
+
+    The worker renews its claim while a batch is in flight, and never claims
+    more recipients than the senders can get through in half a lease.
+    """
+
+    def __init__(self, app, batch_size=500, poll_interval=2.0, lease_seconds=300):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        """Skip the rest of the current poll interval, e.g. right after a message is queued."""
+        self._wake.set()
+
+    def start(self):
+        """Run the worker loop in a daemon thread of the current process."""
+        self._thread = threading.Thread(target=self.run, name='outbox-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        self.app.logger.info(f"Outbox worker {self.worker_id} started")
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    delivered = self.run_once()
+            except Exception as e:
+                self.app.logger.error(f"Outbox worker error: {str(e)}")
+                delivered = 0
+
+            # keep draining while there is work, otherwise sleep until woken or the next poll
+            if not delivered:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Claim and deliver one batch. Returns the number of recipients processed."""
+        claimed = self.claim_batch()
+        if claimed:
+            with self.hold_lease():
+                self.deliver(claimed)
+        return len(claimed)
+
+    def claim_limit(self):
+        """The batch size, capped so a batch is sent well within the lease at the senders' rate."""
+        total_rate = self.app.extensions['sender_pool'].total_rate
+        return max(1, min(self.batch_size, int(total_rate * self.lease_seconds / 2)))
+
+    @contextmanager
+    def hold_lease(self):
+        """Keep renewing this worker's claim on its `sending` rows while the block runs."""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    with self.app.app_context():
+                        db.session.execute(
+                            db.update(MessageRecipient).where(
+                                MessageRecipient.claimed_by == self.worker_id,
+                                MessageRecipient.status == 'sending'
+                            ).values(claimed_at=datetime.now())
+                        )
+                        db.session.commit()
+                except Exception as e:
+                    self.app.logger.error(f"Outbox lease renewal failed: {str(e)}")
+
+        renewer = threading.Thread(target=renew, name='outbox-lease', daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            done.set()
+            renewer.join()
+
+    def claim_batch(self):
+        now = datetime.now()
+        stale_before = now - timedelta(seconds=self.lease_seconds)
+        claimable = db.or_(
+            # new sends of an immediate message; scheduled ones wait for the scheduler
+            db.and_(MessageRecipient.status == 'pending', Message.status == 'pending'),
+            # retries of any message once their backoff is over
+            db.and_(MessageRecipient.status == 'retrying', MessageRecipient.next_attempt_at <= now),
+            db.and_(
+                MessageRecipient.status == 'sending',
+                MessageRecipient.claimed_at < stale_before
+            )
+        )
+
+        query = db.select(MessageRecipient.id).join(Message).where(claimable) \
+            .order_by(MessageRecipient.id).limit(self.claim_limit())
+
+        if db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True, of=MessageRecipient)
+
+        candidate_ids = db.session.execute(query).scalars().all()
+        if not candidate_ids:
+            db.session.rollback()
+            return []
+
+        # the status guard makes the claim safe on databases without SKIP LOCKED
+        db.session.execute(
+            db.update(MessageRecipient).where(
+                MessageRecipient.id.in_(candidate_ids),
+                db.or_(
+                    MessageRecipient.status.in_(['pending', 'retrying']),
+                    db.and_(
+                        MessageRecipient.status == 'sending',
+                        MessageRecipient.claimed_at < stale_before
+                    )
+                )
+            ).values(status='sending', claimed_by=self.worker_id, claimed_at=now)
+        )
+        db.session.commit()
+
+        return MessageRecipient.query.filter(
+            MessageRecipient.id.in_(candidate_ids),
+            MessageRecipient.claimed_by == self.worker_id,
+            MessageRecipient.status == 'sending'
+        ).options(
+            db.joinedload(MessageRecipient.participant),
+            db.joinedload(MessageRecipient.message)
+        ).all()
+
+    def deliver(self, claimed):
+        from routes import build_dispatch_jobs, get_delivery_ledger, get_sms_dispatcher
+
+        by_message = {}
+        for entry in claimed:
+            by_message.setdefault(entry.message, []).append(entry)
+
+        # render every message before the first ledger commit expires the loaded rows
+        batches = []
+        for message, entries in by_message.items():
+            jobs, errors = build_dispatch_jobs(message, [entry.participant for entry in entries])
+            recipients = {entry.participant_id: (entry.id, entry.attempts) for entry in entries}
+            batches.append((message.id, jobs, errors, recipients))
+        # hand the connection back to the pool while the sends are in flight; each ledger flush borrows one briefly
+        db.session.commit()
+
+        for message_id, jobs, errors, recipients in batches:
+            ledger = get_delivery_ledger(message_id, recipients, claimed_by=self.worker_id)
+            try:
+                for participant_id, error in errors.items():
+                    ledger.record({'participant_id': participant_id, 'status': 'failed', 'error': error})
+                get_sms_dispatcher().send_all(jobs, on_result=ledger.record)
+                ledger.flush()
+            except Exception as e:
+                # write the outcomes already buffered; rows without one stay claimed and are retried once the lease expires
+                ledger.salvage()
+                self.app.logger.error(f"Outbox delivery of message {message_id} failed: {str(e)}")
+                continue
+
+            self.app.logger.info(
+                f"Outbox delivered batch of message {message_id}: "
+                f"sent {ledger.sent}, failed {ledger.failed}, retrying {ledger.retrying}"
+            )
+            self.finish_message(db.session.get(Message, message_id))
+
+    def finish_message(self, message):
+        """Mark a message sent once none of its recipients are waiting for delivery."""
+        outstanding = db.session.execute(
+            db.select(db.func.count(MessageRecipient.id)).where(
+                MessageRecipient.message_id == message.id,
+                MessageRecipient.status.in_(['pending', 'sending', 'retrying'])
+            )
+        ).scalar()
+        if outstanding == 0 and message.status == 'pending':
+            message.status = 'sent'
+            message.sent_at = datetime.now()
+            db.session.commit()
+
+
+def init_outbox(app):
+    """Attach an outbox worker to the app and register the `outbox-worker` CLI command.
+
+    With OUTBOX_WORKER=embedded (the default) every web process runs a worker
+    thread; claims keep them from delivering the same recipient twice. With
+    OUTBOX_WORKER=external delivery is left to `flask outbox-worker` processes.
+    """
+    worker = OutboxWorker(
+        app,
+        batch_size=app.config['OUTBOX_BATCH_SIZE'],
+        poll_interval=app.config['OUTBOX_POLL_INTERVAL'],
+        lease_seconds=app.config['OUTBOX_LEASE_SECONDS']
+    )
+    app.extensions['outbox_worker'] = worker
+
+    @app.cli.command('outbox-worker')
+    def outbox_worker_command():
+        """Deliver queued messages until interrupted."""
+        if app.config['METRICS_PORT']:
+            metrics.serve(app.config['METRICS_PORT'], app.config['METRICS_TOKEN'])
+        worker.run()
+
+    return worker
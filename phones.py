@@ -0,0 +1,78 @@
+import re
+from functools import lru_cache
+
+# ITU-T E.164 assigned country calling codes
+COUNTRY_CODES = frozenset({
+    '1', '7', '20', '27', '30', '31', '32', '33', '34', '36', '39', '40', '41', '43', '44', '45', '46',
+    '47', '48', '49', '51', '52', '53', '54', '55', '56', '57', '58', '60', '61', '62', '63', '64', '65',
+    '66', '81', '82', '84', '86', '90', '91', '92', '93', '94', '95', '98',
+    '211', '212', '213', '216', '218', '220', '221', '222', '223', '224', '225', '226', '227', '228',
+    '229', '230', '231', '232', '233', '234', '235', '236', '237', '238', '239', '240', '241', '242',
+    '243', '244', '245', '246', '247', '248', '249', '250', '251', '252', '253', '254', '255', '256',
+    '257', '258', '260', '261', '262', '263', '264', '265', '266', '267', '268', '269', '290', '291',
+    '297', '298', '299', '350', '351', '352', '353', '354', '355', '356', '357', '358', '359', '370',
+    '371', '372', '373', '374', '375', '376', '377', '378', '379', '380', '381', '382', '383', '385',
+    '386', '387', '389', '420', '421', '423', '500', '501', '502', '503', '504', '505', '506', '507',
+    '508', '509', '590', '591', '592', '593', '594', '595', '596', '597', '598', '599', '670', '672',
+    '673', '674', '675', '676', '677', '678', '679', '680', '681', '682', '683', '685', '686', '687',
+    '688', '689', '690', '691', '692', '850', '852', '853', '855', '856', '880', '886', '960', '961',
+    '962', '963', '964', '965', '966', '967', '968', '970', '971', '972', '973', '974', '975', '976',
+    '977', '992', '993', '994', '995', '996', '998',
+})
+
+# error codes returned alongside a failed normalization
+EMPTY = 'empty'
+INVALID_LENGTH = 'invalid_length'
+UNKNOWN_COUNTRY_CODE = 'unknown_country_code'
+
+ERROR_MESSAGES = {
+    EMPTY: 'Missing phone number',
+    INVALID_LENGTH: 'Invalid phone number format',
+    UNKNOWN_COUNTRY_CODE: 'Unknown country code in phone number',
+}
+
+_NON_DIGITS = re.compile(r'\D')
+_INTERNATIONAL_PREFIX = re.compile(r'^\s*(\+|00)')
+
+
+@lru_cache(maxsize=65536)
+def normalize_phone(raw:str):
+    """Normalize one phone number to E.164.
+
+    Numbers written with a leading + or 00 keep their country code; anything
+    else is read as a North American number (10 digits, or 11 starting with 1).
+    Returns (e164, None) on success and (None, error_code) otherwise.
+    """
+    if not raw or not raw.strip():
+        return None, EMPTY
+
+    international = _INTERNATIONAL_PREFIX.match(raw)
+    digits = _NON_DIGITS.sub('', raw)
+
+    if international:
+        if international.group(1) == '00':
+            digits = digits[2:]
+        # E.164 allows at most 15 digits; nothing real is shorter than 8
+        if not 8 <= len(digits) <= 15:
+            return None, INVALID_LENGTH
+        # North American numbers are always exactly 1 + 10 digits
+        if digits.startswith('1') and len(digits) != 11:
+            return None, INVALID_LENGTH
+        if not any(digits[:length] in COUNTRY_CODES for length in (1, 2, 3)):
+            return None, UNKNOWN_COUNTRY_CODE
+        return '+' + digits, None
+
+    if len(digits) == 10:
+        return '+1' + digits, None
+    if len(digits) == 11 and digits.startswith('1'):
+        return '+' + digits, None
+    return None, INVALID_LENGTH
+
+
+def normalize_phones(values):
+    """Normalize a whole column of phone numbers.
+
+    Returns a list of (e164, error_code) pairs in the same order as `values`;
+    repeated inputs are served from the cache.
+    """
+    return [normalize_phone(value if isinstance(value, str) else '') for value in values]
@@ -0,0 +1,193 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+import uuid
+import aiohttp
+import metrics
+
+TWILIO_MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+
+
+class SmsProvider:
+    """Interface every SMS backend implements.
+
+    `sender` is a `senders.Sender`; its `params` hold either `From` or
+    `MessagingServiceSid`. `send_async` returns a dict with `status`
+    ('sent', 'failed' or 'throttled') and, depending on the status, `sid`,
+    `error` or `retry_after` (seconds). Failures also say whether trying again
+    could help (`retryable`) and carry the provider's `error_code` when there
+    is one. They never raise for delivery errors.
+    """
+
+    name = None
+
+    def open_session(self, concurrency:int):
+        """Async context manager yielding whatever `send_async` needs to share across one blast."""
+        return contextlib.nullcontext()
+
+    async def send_async(self, session, sender, to:str, body:str) -> dict:
+        raise NotImplementedError
+
+
+class HttpTransport:
+    """Keep-alive HTTPS connections to the provider, shared by every send of a process.
+
+    Async sends get an aiohttp session holding up to `pool_size` connections
+    (the dispatch concurrency) that stay open for `keepalive` idle seconds, so
+    consecutive blasts and outbox batches reuse warm TLS connections instead
+    of opening new ones. An aiohttp session belongs to one event loop; each
+    sending thread runs its blasts on its own long-lived loop (see
+    `dispatch.thread_event_loop`) and gets its own session here.
+    """
+
+    def __init__(self, pool_size=100, keepalive=30.0, connect_timeout=5.0, read_timeout=15.0, provider='twilio'):
+        self.pool_size = max(1, int(pool_size))
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.provider = provider
+        self.stats = {'requests': 0, 'connections_created': 0, 'connections_reused': 0}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    async def session(self) -> aiohttp.ClientSession:
+        """This thread's session, opened on first use from the running event loop."""
+        loop = asyncio.get_running_loop()
+        local = self._local
+        if getattr(local, 'loop', None) is not loop or local.session.closed:
+            local.loop = loop
+            local.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                trace_configs=[self._trace_config()]
+            )
+        return local.session
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self._count('requests')
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self._count('connections_created')
+            metrics.sms_http_connections.inc(provider=self.provider, outcome='created')
+            metrics.sms_http_connect_duration.observe(time.perf_counter() - context.connect_started, provider=self.provider)
+
+        async def on_connection_reuseconn(session, context, params):
+            self._count('connections_reused')
+            metrics.sms_http_connections.inc(provider=self.provider, outcome='reused')
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+
+class TwilioProvider(SmsProvider):
+    """Twilio REST API, called through aiohttp."""
+
+    name = 'twilio'
+
+    def __init__(self, account_sid, auth_token, status_callback=None, transport=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.status_callback = status_callback  # URL Twilio posts delivery receipts to
+        self.transport = transport or HttpTransport()
+        self.url = TWILIO_MESSAGES_URL.format(account_sid=account_sid)
+        self.auth = aiohttp.BasicAuth(account_sid or '', auth_token or '')
+
+    @contextlib.asynccontextmanager
+    async def open_session(self, concurrency):
+        # the transport's session outlives the blast, keeping its connections warm for the next one
+        yield await self.transport.session()
+
+    async def send_async(self, session, sender, to, body):
+        try:
+            data = {**sender.params, 'To': to, 'Body': body}
+            if self.status_callback:
+                data['StatusCallback'] = self.status_callback
+            async with session.post(self.url, data=data, auth=self.auth) as response:
+                payload = await response.json(content_type=None)
+                if response.status < 300:
+                    return {'status': 'sent', 'sid': payload.get('sid')}
+                error = payload.get('message', f'HTTP {response.status}')
+                if response.status == 429:
+                    return {'status': 'throttled', 'retry_after': float(response.headers.get('Retry-After', 1)), 'error': error}
+                return {'status': 'failed', 'error': error, 'error_code': payload.get('code'), 'retryable': response.status >= 500}
+        except Exception as e:
+            # connection errors and timeouts
+            return {'status': 'failed', 'error': str(e) or type(e).__name__, 'retryable': True}
+
+
+class FakeSmsProvider(SmsProvider):
+    """In-process stand-in for load tests: no network, no cost.
+
+    Every send takes `latency` seconds (plus up to `jitter` more), a fraction
+    `error_rate` of sends fail and a fraction `throttle_rate` come back as 429s.
+    Counts of each outcome are kept in `stats`.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, throttle_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.stats = {'sent': 0, 'failed': 0, 'throttled': 0}
+        self.lock = threading.Lock()
+
+    def _delay(self):
+        return self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+
+    def _outcome(self):
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            result = {'status': 'throttled', 'retry_after': 1.0, 'error': 'Too Many Requests'}
+        elif roll < self.throttle_rate + self.error_rate:
+            result = {'status': 'failed', 'error': 'Fake provider error', 'retryable': True}
+        else:
+            result = {'status': 'sent', 'sid': 'SMfake' + uuid.uuid4().hex}
+        with self.lock:
+            self.stats[result['status']] += 1
+        return result
+
+    async def send_async(self, session, sender, to, body):
+        await asyncio.sleep(self._delay())
+        return self._outcome()
+
+
+def create_provider(config):
+    """Build the provider selected by SMS_PROVIDER."""
+    if config['SMS_PROVIDER'] == 'fake':
+        return FakeSmsProvider(
+            latency=config['SMS_FAKE_LATENCY'],
+            jitter=config['SMS_FAKE_JITTER'],
+            error_rate=config['SMS_FAKE_ERROR_RATE'],
+            throttle_rate=config['SMS_FAKE_THROTTLE_RATE']
+        )
+    if config['SMS_PROVIDER'] == 'twilio':
+        return TwilioProvider(
+            config['TWILIO_ACCOUNT_SID'],
+            config['TWILIO_AUTH_TOKEN'],
+            status_callback=config.get('SMS_STATUS_CALLBACK_URL'),
+            transport=HttpTransport(
+                pool_size=config['SMS_DISPATCH_CONCURRENCY'],
+                keepalive=config['SMS_HTTP_KEEPALIVE'],
+                connect_timeout=config['SMS_HTTP_CONNECT_TIMEOUT'],
+                read_timeout=config['SMS_HTTP_READ_TIMEOUT']
+            )
+        )
+    raise ValueError(f"Unknown SMS_PROVIDER: {config['SMS_PROVIDER']}")
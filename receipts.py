@@ -0,0 +1,177 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from extensions import db
+from models import Message, MessageRecipient
+
+# provider delivery statuses in the order a message moves through them; the
+# last three are final. A receipt never moves a row back to an earlier status,
+# so callbacks arriving out of order can't undo a final outcome.
+DELIVERY_STATUS_RANK = {
+    'accepted': 0,
+    'queued': 0,
+    'sending': 1,
+    'sent': 1,
+    'delivered': 2,
+    'undelivered': 2,
+    'failed': 2,
+}
+# final statuses counted as undelivered on the message
+FAILED_DELIVERY_STATUSES = ('undelivered', 'failed')
+
+
+class DeliveryReceiptBuffer:
+    """Collect provider delivery receipts and apply them to MessageRecipient in batches.
+
+    `add` only touches an in-memory dict keyed by provider SID (keeping the
+    most advanced status per SID), so a status callback returns without a
+    database round trip. A flusher thread writes the buffer every
+    `flush_interval` seconds, or as soon as it holds `flush_size` receipts,
+    with one executemany UPDATE per delivery status and message, and adds the
+    recipients each UPDATE moved to `delivered`, or to `undelivered`/`failed`,
+    to their message's delivered or undelivered counter. Receipts can arrive before
+    the sending side has recorded the SID; those are kept and retried until
+    they are `max_age` seconds old.
+    """
+
+    def __init__(self, app, flush_size=1000, flush_interval=1.0, max_age=120.0):
+        self.app = app
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.applied = 0
+        self.dropped = 0
+        self._receipts = {}  # sid -> (status, error_code, received_at monotonic)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, sid, status, error_code=None):
+        rank = DELIVERY_STATUS_RANK.get(status)
+        if not sid or rank is None:
+            return False
+
+        with self._lock:
+            current = self._receipts.get(sid)
+            if current is None or DELIVERY_STATUS_RANK[current[0]] <= rank:
+                self._receipts[sid] = (status, error_code, current[2] if current else time.monotonic())
+            buffered = len(self._receipts)
+            if self._thread is None:
+                self._start()
+
+        if buffered >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def _start(self):
+        self._thread = threading.Thread(target=self.run, name='delivery-receipts', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f"Delivery receipt flush failed: {str(e)}")
+
+    def flush(self):
+        """Apply everything buffered so far. Returns the number of receipts applied."""
+        with self._lock:
+            receipts, self._receipts = self._receipts, {}
+        if not receipts:
+            return 0
+
+        try:
+            with self.app.app_context():
+                applied, unmatched = self.apply(receipts)
+        except Exception:
+            # put the batch back, without overriding anything newer that arrived meanwhile
+            with self._lock:
+                for sid, receipt in receipts.items():
+                    self._receipts.setdefault(sid, receipt)
+            raise
+
+        now = time.monotonic()
+        retry = {sid: receipts[sid] for sid in unmatched if now - receipts[sid][2] < self.max_age}
+        with self._lock:
+            for sid, receipt in retry.items():
+                self._receipts.setdefault(sid, receipt)
+        self.applied += applied
+        self.dropped += len(unmatched) - len(retry)
+        return applied
+
+    def apply(self, receipts):
+        """Write one batch of receipts. Returns (applied count, SIDs with no recipient row yet)."""
+        matched = {}  # sid -> message id
+        sids = list(receipts)
+        for start in range(0, len(sids), 500):
+            query = db.select(MessageRecipient.provider_sid, MessageRecipient.message_id) \
+                .where(MessageRecipient.provider_sid.in_(sids[start:start + 500]))
+            matched.update(db.session.execute(query).all())
+
+        now = datetime.now()
+        batches = {}  # (status, message id) -> parameters
+        for sid, message_id in matched.items():
+            status, error_code, _ = receipts[sid]
+            batches.setdefault((status, message_id), []).append({
+                'b_sid': sid,
+                'b_delivered_at': now if status == 'delivered' else None,
+                'b_error_message': f"Delivery {status}: error {error_code}" if error_code else None,
+            })
+
+        table = MessageRecipient.__table__
+        counters = {}  # message id -> {'b_delivered': n, 'b_undelivered': n}
+        for (status, message_id), params in batches.items():
+            earlier = [name for name, rank in DELIVERY_STATUS_RANK.items() if rank < DELIVERY_STATUS_RANK[status]]
+            statement = db.update(table).where(
+                table.c.provider_sid == db.bindparam('b_sid'),
+                # inline the statuses: an expanding IN parameter can't be used with executemany
+                db.or_(
+                    table.c.delivery_status.is_(None),
+                    *[table.c.delivery_status == db.literal_column(f"'{name}'") for name in earlier]
+                )
+            ).values(
+                delivery_status=status,
+                delivered_at=db.bindparam('b_delivered_at'),
+                error_message=db.func.coalesce(db.bindparam('b_error_message'), table.c.error_message)
+            )
+            # the rowcount only includes rows this UPDATE moved forward, so a concurrent
+            # flush of the same receipt can't count a recipient twice
+            changed = db.session.execute(statement, params).rowcount
+            if status == 'delivered':
+                counter = 'b_delivered'
+            elif status in FAILED_DELIVERY_STATUSES:
+                counter = 'b_undelivered'
+            else:
+                continue
+            if changed:
+                counts = counters.setdefault(message_id, {'b_delivered': 0, 'b_undelivered': 0})
+                counts[counter] += changed
+
+        if counters:
+            messages = Message.__table__
+            db.session.execute(
+                db.update(messages).where(messages.c.id == db.bindparam('b_id')).values(
+                    delivered_count=messages.c.delivered_count + db.bindparam('b_delivered'),
+                    undelivered_count=messages.c.undelivered_count + db.bindparam('b_undelivered')
+                ),
+                [{'b_id': message_id, **counts} for message_id, counts in counters.items()]
+            )
+        db.session.commit()
+
+        return len(matched), [sid for sid in receipts if sid not in matched]
+
+
+def init_receipts(app):
+    """Attach the delivery receipt buffer used by the status callback endpoint."""
+    buffer = DeliveryReceiptBuffer(
+        app,
+        flush_size=app.config['RECEIPT_FLUSH_SIZE'],
+        flush_interval=app.config['RECEIPT_FLUSH_INTERVAL']
+    )
+    app.extensions['receipt_buffer'] = buffer
+    return buffer
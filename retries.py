@@ -0,0 +1,52 @@
+import random
+from datetime import datetime, timedelta
+
+# Twilio error codes that will fail the same way however often they are retried
+# (invalid or unreachable number, opted out, blocked or rejected content).
+PERMANENT_TWILIO_ERRORS = frozenset({
+    21211, 21212, 21214, 21217, 21219, 21408, 21601, 21602, 21610, 21612, 21614,
+    21617, 30003, 30004, 30005, 30006, 30007, 30008,
+})
+
+
+def is_retryable(result:dict) -> bool:
+    """Whether a failed send might succeed if tried again.
+
+    Providers mark their results with `retryable`; anything unmarked (render
+    errors, missing data) is treated as permanent.
+    """
+    if result.get('error_code') in PERMANENT_TWILIO_ERRORS:
+        return False
+    return bool(result.get('retryable'))
+
+
+class RetryPolicy:
+    """When, and whether, a recipient whose send failed is tried again.
+
+    Attempt n waits base_delay * 2**(n-1) seconds, capped at max_delay, with
+    "equal jitter": half the delay is fixed and half random, so recipients that
+    failed together don't all come back at the same instant.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=30.0, max_delay=900.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_attempts=config['SMS_MAX_ATTEMPTS'],
+            base_delay=config['SMS_RETRY_BASE_DELAY'],
+            max_delay=config['SMS_RETRY_MAX_DELAY']
+        )
+
+    def backoff(self, attempts:int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** max(attempts - 1, 0))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def next_attempt_at(self, result:dict, attempts:int):
+        """When to try again after `attempts` failed sends, or None to give up."""
+        if attempts >= self.max_attempts or not is_retryable(result):
+            return None
+        return datetime.now() + timedelta(seconds=self.backoff(attempts))
@@ -1,31 +1,42 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, Response, current_app
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, Response, current_app, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash
-from models import Admin, Conference, Participant, Message, MessageRecipient
+from werkzeug.utils import secure_filename
+from models import Admin, Participant, Message, MessageRecipient, ImportJob
 from forms import LoginForm
 from extensions import db
-from io import TextIOWrapper
-from datetime import datetime
-from twilio.rest import Client
+from io import StringIO, TextIOWrapper
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor
+from twilio.request_validator import RequestValidator
+from sqlalchemy.exc import IntegrityError
+from dispatch import SmsDispatcher
+from ledger import DeliveryLedger
+from message_templates import compile_template, TemplateError
+from cache import participant_count_cache, get_conference, get_conferences
+from search import search_participants
+import metrics
+from itertools import count, islice
+from phones import normalize_phone, normalize_phones, ERROR_MESSAGES as PHONE_ERROR_MESSAGES
 import os
+import codecs
+import json
 import csv
-import re
+import threading
+import uuid
+from contextlib import contextmanager
 
 routes = Blueprint('routes', __name__)
 
+IMPORT_CHUNK_SIZE = 1000  # rows committed together by a background import
+EXPORT_CHUNK_SIZE = 1000  # rows fetched and written together by a CSV export
+MESSAGE_HISTORY_PAGE_SIZE = 50  # messages per page of the message history
+
 # env variables
 load_dotenv(".env")
-twilio_client = Client(os.environ.get('TWILIO_ACCOUNT_SID'), os.environ.get('TWILIO_AUTH_TOKEN'))
-twilio_number:str = os.environ.get('TWILIO_PHONE_NUMBER')
 
 
 ################### INITIAL STUFF ###################
-@routes.before_app_request
-def initialize_conferences():
-    Conference.init_default_conferences()
-
 @routes.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
@@ -54,11 +65,9 @@ def logout():
 
 @routes.app_context_processor
 def inject_conference():
-    from models import Conference  # avoid circular import issues if needed
     if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated:
         if current_user.conference_id:
-            conference = Conference.query.get(current_user.conference_id)
-            return {'conference': conference}
+            return {'conference': get_conference(current_user.conference_id)}
     return {'conference': None}
 
 @routes.route('/select_conference', methods=['GET', 'POST'])
@@ -71,7 +80,7 @@ def select_conference():
             db.session.commit()
             return redirect(url_for('routes.dashboard'))
 
-    conferences = Conference.query.all()
+    conferences = list(get_conferences().values())
     
     # Provide a default conference (first in the list) to avoid errors in base.html
     default_conference = conferences[0] if conferences else None
@@ -84,25 +93,8 @@ def dashboard():
     if not current_user.conference_id:
         return redirect(url_for('routes.select_conference'))
     
-    conference = Conference.query.get(current_user.conference_id)
-    participant_counts = {
-        'delegates': Participant.query.filter_by(
-            conference_id=current_user.conference_id,
-            participant_type='Delegate'
-        ).count(),
-        'advisors': Participant.query.filter_by(
-            conference_id=current_user.conference_id,
-            participant_type='Advisor'
-        ).count(),
-        'staff': Participant.query.filter_by(
-            conference_id=current_user.conference_id,
-            participant_type='Staff'
-        ).count(),
-        'secretariat': Participant.query.filter_by(
-            conference_id=current_user.conference_id,
-            participant_type='Secretariat'
-        ).count()
-    }
+    conference = get_conference(current_user.conference_id)
+    participant_counts = get_participant_counts(current_user.conference_id)
     
     recent_messages = Message.query.filter(
         Message.sent_by == current_user.id,
@@ -123,38 +115,99 @@ def dashboard():
     )
 
 
+PARTICIPANT_COUNT_KEYS = {
+    'Delegate': 'delegates',
+    'Advisor': 'advisors',
+    'Staff': 'staff',
+    'Secretariat': 'secretariat'
+}
+
+def get_participant_counts(conference_id):
+    """Participant counts per type for a conference, from one GROUP BY query cached per process."""
+    def load():
+        counts = dict(db.session.execute(
+            db.select(Participant.participant_type, db.func.count(Participant.id))
+            .where(Participant.conference_id == conference_id)
+            .group_by(Participant.participant_type)
+        ).all())
+        return {key: counts.get(participant_type, 0) for participant_type, key in PARTICIPANT_COUNT_KEYS.items()}
+
+    return participant_count_cache.get_or_load(conference_id, load)
+
+def adjust_participant_count(conference_id, participant_type, delta):
+    """Keep the cached counts in step with a single add, delete or type change."""
+    key = PARTICIPANT_COUNT_KEYS.get(participant_type)
+    if key:
+        participant_count_cache.update(conference_id, lambda counts: counts.__setitem__(key, counts[key] + delta))
+
+
 ################### UPLOADING PARTICIPANTS ###################
 
-def try_read_csv(file):
-    """Try reading CSV with different encodings and handle BOM"""
-    encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252']
-    
-    for encoding in encodings:
+CSV_SAMPLE_BYTES = 64 * 1024  # prefix sampled once to pick the encoding and delimiter
+
+def _decode_as_cp1252(error):
+    """Codec error handler: decode bytes that are not valid UTF-8 as cp1252 instead of failing."""
+    bad_bytes = error.object[error.start:error.end]
+    return bad_bytes.decode('cp1252', errors='replace'), error.end
+
+codecs.register_error('cp1252fallback', _decode_as_cp1252)
+
+def detect_csv_format(sample:bytes):
+    """Pick an encoding and delimiter from the first bytes of a file."""
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
         try:
-            # Reset file pointer
-            file.seek(0)
-            csv_file = TextIOWrapper(file, encoding=encoding)
-            reader = csv.DictReader(csv_file)
-
-            if not reader.fieldnames:
-                continue
-
-            # Clean header fields - remove BOM and whitespace
-            cleaned_headers = [
-                field.strip().lstrip('\ufeff') for field in reader.fieldnames
-            ]
-            reader.fieldnames = cleaned_headers
-            header_fields = set(cleaned_headers)
-            
-            return reader, header_fields
-            
+            # final=False tolerates a multi-byte character cut off at the end of the sample
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+            encoding = 'utf-8'
         except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            current_app.logger.error(f"Error reading CSV with {encoding}: {str(e)}")
-            continue
-            
-    raise ValueError("Unable to read CSV file with any supported encoding")
+            encoding = 'cp1252'
+
+    text = sample.decode(encoding, errors='replace')
+    # only sniff complete lines so a row cut off by the sample doesn't confuse it
+    if len(sample) == CSV_SAMPLE_BYTES and '\n' in text:
+        text = text[:text.rindex('\n')]
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+
+    return encoding, delimiter
+
+def try_read_csv(file):
+    """Open an uploaded CSV as a streaming DictReader.
+
+    The encoding (UTF-8 with or without BOM, else cp1252) and the delimiter
+    are detected from a bounded prefix of the file, read once. Stray bytes
+    later in a UTF-8 file are decoded as cp1252 rather than failing the
+    import halfway through.
+    """
+    sample = file.read(CSV_SAMPLE_BYTES)
+    if not sample:
+        raise ValueError("Unable to read CSV file: the file is empty")
+    file.seek(0)
+
+    encoding, delimiter = detect_csv_format(sample)
+    csv_file = TextIOWrapper(
+        file,
+        encoding=encoding,
+        errors='cp1252fallback' if encoding.startswith('utf-8') else 'replace',
+        newline=''
+    )
+    reader = csv.DictReader(csv_file, delimiter=delimiter)
+
+    if not reader.fieldnames:
+        raise ValueError("Unable to read CSV file: no header row found")
+
+    # Clean header fields - remove BOM and whitespace
+    cleaned_headers = [
+        field.strip().lstrip('\ufeff') for field in reader.fieldnames
+    ]
+    reader.fieldnames = cleaned_headers
+    header_fields = set(cleaned_headers)
+
+    return reader, header_fields
 
 @routes.route('/upload_participants', methods=['GET', 'POST'])
 @login_required
@@ -203,18 +256,29 @@ def upload_participants():
                         'message': f'Missing required columns: {", ".join(missing_fields)}'
                     }), 400
 
-                # Clear existing participants if checkbox is checked
-                if request.form.get('clear_existing') == 'yes':
-                    clear_conference_participants(current_user.conference_id)
-
-                results = process_participant_upload(csv_reader, current_user.conference_id)
+                # hand the file to a background job; the page polls its progress
+                upload_folder = current_app.config['UPLOAD_FOLDER']
+                os.makedirs(upload_folder, exist_ok=True)
+                path = os.path.join(upload_folder, f'import_{uuid.uuid4().hex}.csv')
+                file.stream.seek(0)
+                file.save(path)
+
+                job = ImportJob(
+                    conference_id=current_user.conference_id,
+                    created_by=current_user.id,
+                    filename=file.filename,
+                    total_bytes=os.path.getsize(path)
+                )
+                db.session.add(job)
                 db.session.commit()
 
+                start_import_job(job.id, path, clear_existing=request.form.get('clear_existing') == 'yes')
+
                 return jsonify({
                     'success': True,
-                    'message': f'Successfully imported {results["success"]} participants. {results["errors"]} errors occurred.',
-                    'errors': results['error_messages']
-                })
+                    'message': 'Import started',
+                    'job_id': job.id
+                }), 202
 
             except Exception as e:
                 db.session.rollback()
@@ -230,60 +294,237 @@ def upload_participants():
             }), 500
 
     # GET request - render template
-    conference = Conference.query.get(current_user.conference_id)
+    conference = get_conference(current_user.conference_id)
     return render_template('upload_participants.html', conference=conference)
 
-def process_participant_upload(csv_reader, conference_id):
-    """Process CSV upload and return results summary"""
+@routes.route('/upload_participants/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def import_job_status(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    if job.conference_id != current_user.conference_id:
+        return jsonify({'success': False, 'message': 'Import not found'}), 404
+
+    fail_abandoned_import_job(job)
+
+    eta_seconds = None
+    if job.status == 'running' and job.started_at and job.bytes_processed:
+        elapsed = (datetime.now() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed * (job.total_bytes - job.bytes_processed) / job.bytes_processed, 1)
+
+    finished = job.status in ('done', 'failed')
+    return jsonify({
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'success_count': job.success_count,
+        'error_count': job.error_count,
+        'eta_seconds': eta_seconds,
+        'message': job.message,
+        'errors': job.error_messages.splitlines() if finished and job.error_messages else []
+    })
+
+def fail_abandoned_import_job(job:ImportJob):
+    """Mark a job failed if its heartbeat has been silent for longer than IMPORT_JOB_TIMEOUT.
+
+    Imports run in a thread of the process that accepted the upload; when that
+    process exits (a deploy, a worker restart) the job row is never finished.
+    A running import bumps `heartbeat_at` every third of the timeout, however
+    long the import itself takes.
+    """
+    if job.status not in ('queued', 'running'):
+        return
+    stale_before = datetime.now() - timedelta(seconds=current_app.config.get('IMPORT_JOB_TIMEOUT', 300))
+    if (job.heartbeat_at or job.started_at or job.created_at) >= stale_before:
+        return
+
+    # conditional, so a heartbeat or the job's own last update that landed meanwhile wins
+    db.session.execute(
+        db.update(ImportJob).where(
+            ImportJob.id == job.id,
+            ImportJob.status.in_(['queued', 'running']),
+            db.func.coalesce(ImportJob.heartbeat_at, ImportJob.started_at, ImportJob.created_at) < stale_before
+        ).values(
+            status='failed',
+            message=(
+                f'The import stopped after {job.rows_processed} rows without finishing, '
+                f'probably because the server restarted. Upload the file again to import the rest.'
+            ),
+            finished_at=datetime.now()
+        )
+    )
+    db.session.commit()
+    db.session.refresh(job)
+
+@contextmanager
+def import_job_heartbeat(app, job_id):
+    """Keep bumping a running job's heartbeat_at while the block runs."""
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(app.config.get('IMPORT_JOB_TIMEOUT', 300) / 3):
+            try:
+                with app.app_context():
+                    db.session.execute(
+                        db.update(ImportJob).where(ImportJob.id == job_id, ImportJob.status == 'running')
+                        .values(heartbeat_at=datetime.now())
+                    )
+                    db.session.commit()
+            except Exception as e:
+                app.logger.error(f"Heartbeat of import job {job_id} failed: {str(e)}")
+
+    heartbeat = threading.Thread(target=beat, name=f'import-heartbeat-{job_id}', daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        done.set()
+        heartbeat.join()
+
+def start_import_job(job_id, path, clear_existing=False):
+    """Run an import job in a background thread of this process."""
+    app = current_app._get_current_object()
+    thread = threading.Thread(
+        target=run_import_job,
+        args=(app, job_id, path, clear_existing),
+        name=f'import-job-{job_id}',
+        daemon=True
+    )
+    thread.start()
+
+def run_import_job(app, job_id, path, clear_existing):
+    """Stream the saved CSV in chunks, committing and recording progress after each one."""
+    with app.app_context():
+        now = datetime.now()
+        started = db.session.execute(
+            db.update(ImportJob).where(ImportJob.id == job_id, ImportJob.status == 'queued')
+            .values(status='running', started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        if not started:
+            # given up on while it waited
+            remove_upload(path)
+            return
+        job = db.session.get(ImportJob, job_id)
+
+        try:
+            with import_job_heartbeat(app, job_id), open(path, 'rb') as file:
+                csv_reader, header_fields = try_read_csv(file)
+
+                if clear_existing:
+                    clear_conference_participants(job.conference_id)
+                    db.session.commit()
+                    participant_count_cache.invalidate(job.conference_id)
+
+                existing_ids = load_participant_ids(job.conference_id)
+                row_num = 2  # Start at 2 to account for header row
+                while job.status == 'running':  # reloaded after every commit; failed if given up on
+                    chunk = list(islice(csv_reader, IMPORT_CHUNK_SIZE))
+                    if not chunk:
+                        break
+
+                    results = process_participant_upload(chunk, job.conference_id, existing_ids, start_row=row_num)
+                    row_num += len(chunk)
+
+                    job.rows_processed += len(chunk)
+                    job.success_count += results['success']
+                    job.error_count += results['errors']
+                    if results['error_messages']:
+                        job.error_messages = (job.error_messages or '') + ''.join(f'{error}\n' for error in results['error_messages'])
+                    job.bytes_processed = file.tell()
+                    db.session.commit()
+                    participant_count_cache.invalidate(job.conference_id)
+                    metrics.csv_import_rows.inc(results['success'], outcome='success')
+                    metrics.csv_import_rows.inc(results['errors'], outcome='error')
+
+            status = 'done'
+            message = f'Successfully imported {job.success_count} participants. {job.error_count} errors occurred.'
+            elapsed = (datetime.now() - job.started_at).total_seconds()
+            if elapsed > 0:
+                metrics.csv_import_rows_per_second.set(job.rows_processed / elapsed)
+
+        except Exception as e:
+            db.session.rollback()
+            status = 'failed'
+            message = f'Error processing CSV file after {job.rows_processed} rows: {str(e)}'
+            app.logger.error(f"Import job {job_id} failed: {str(e)}")
+
+        # a job already marked failed as abandoned keeps that outcome
+        db.session.execute(
+            db.update(ImportJob).where(ImportJob.id == job_id, ImportJob.status == 'running')
+            .values(status=status, message=message, finished_at=datetime.now())
+        )
+        db.session.commit()
+        remove_upload(path)
+
+def remove_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def load_participant_ids(conference_id):
+    """Map phone -> participant id for everyone already in a conference."""
+    return dict(db.session.execute(
+        db.select(Participant.phone, Participant.id).where(Participant.conference_id == conference_id)
+    ).all())
+
+def process_participant_upload(csv_reader, conference_id, existing_ids=None, start_row=2):
+    """Process CSV upload and return results summary
+
+    Existing participants are looked up once for the whole file and rows are
+    split into inserts and updates in memory, then written with one bulk
+    INSERT and one bulk UPDATE instead of a query and an add per row. When
+    importing in chunks, pass the same `existing_ids` map to every call; it is
+    kept up to date with the participants each chunk inserts.
+    """
     success_count = 0
     error_count = 0
     error_messages = []
-    
-    for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 to account for header row
-        try:
-            # trim whitespace and normalize keys (handles BOM or stray spaces)
-            row = {
-                (k.strip().lstrip('\ufeff') if isinstance(k, str) else k):
-                (v.strip() if isinstance(v, str) else v)
-                for k, v in row.items()
-            }
+    valid_types = {'Delegate', 'Advisor', 'Staff', 'Secretariat'}
+
+    if existing_ids is None:
+        existing_ids = load_participant_ids(conference_id)
+    inserts = {}  # phone -> new participant values
+    updates = {}  # participant id -> updated values
+
+    # trim whitespace and normalize keys (handles BOM or stray spaces)
+    rows = [
+        {
+            (k.strip().lstrip('\ufeff') if isinstance(k, str) else k):
+            (v.strip() if isinstance(v, str) else v)
+            for k, v in row.items()
+        }
+        for row in csv_reader
+    ]
+    # clean and validate the whole phone column at once
+    phones = normalize_phones([row.get('phone') for row in rows])
 
+    for row_num, row, (phone, phone_error) in zip(count(start_row), rows, phones):
+        try:
             # validate required fields
             if not all(row.get(field, '').strip() for field in ['first_name', 'last_name', 'phone']):
                 raise ValueError('Missing required fields')
             
             # validate participant type
             participant_type = row.get('participant_type', '').strip()
-            valid_types = {'Delegate', 'Advisor', 'Staff', 'Secretariat'}
             if participant_type not in valid_types:
                 raise ValueError(f'Invalid participant type. Must be one of: {", ".join(valid_types)}')
             
-            # clean and validate phone number
-            phone = clean_phone_number(row.get('phone', ''))
-            if not phone:
-                raise ValueError('Invalid phone number format')
-            
-            # check for existing participant with same phone number
-            existing = Participant.query.filter_by(
-                conference_id=conference_id,
-                phone=phone
-            ).first()
-            
-            if existing:
-                # update existing participant
-                existing.first_name = row['first_name'].strip()
-                existing.last_name = row['last_name'].strip()
-                existing.participant_type = participant_type
+            if phone_error:
+                raise ValueError(PHONE_ERROR_MESSAGES[phone_error])
+
+            values = {
+                'first_name': row['first_name'].strip(),
+                'last_name': row['last_name'].strip(),
+                'participant_type': participant_type
+            }
+
+            # a later row with the same phone number wins, whether it is new or already stored
+            if phone in existing_ids:
+                updates[existing_ids[phone]] = {'id': existing_ids[phone], **values}
+            elif phone in inserts:
+                inserts[phone].update(values)
             else:
-                # create new participant
-                participant = Participant(
-                    conference_id=conference_id,
-                    first_name=row['first_name'].strip(),
-                    last_name=row['last_name'].strip(),
-                    phone=phone,
-                    participant_type=participant_type
-                )
-                db.session.add(participant)
+                inserts[phone] = {'conference_id': conference_id, 'phone': phone, **values}
             
             success_count += 1
             
@@ -292,6 +533,17 @@ def process_participant_upload(csv_reader, conference_id):
             error_messages.append(
                 f"Row {row_num}: Error processing {row.get('first_name', '')} {row.get('last_name', '')}: {str(e)}"
             )
+
+    if inserts:
+        db.session.execute(participant_upsert_statement(), list(inserts.values()))
+        existing_ids.update(db.session.execute(
+            db.select(Participant.phone, Participant.id).where(
+                Participant.conference_id == conference_id,
+                Participant.phone.in_(list(inserts))
+            )
+        ).all())
+    if updates:
+        db.session.execute(db.update(Participant), list(updates.values()))
     
     return {
         'success': success_count,
@@ -299,6 +551,30 @@ def process_participant_upload(csv_reader, conference_id):
         'error_messages': error_messages
     }
 
+def participant_upsert_statement():
+    """INSERT for new participants that updates instead if the phone already exists in the conference.
+
+    Relies on the unique (conference_id, phone) constraint, so a concurrent
+    import or manual add can't produce a duplicate or fail the whole chunk.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return db.insert(Participant)
+
+    statement = insert(Participant)
+    return statement.on_conflict_do_update(
+        index_elements=['conference_id', 'phone'],
+        set_={
+            'first_name': statement.excluded.first_name,
+            'last_name': statement.excluded.last_name,
+            'participant_type': statement.excluded.participant_type
+        }
+    )
+
 def clear_conference_participants(conference_id):
     """Delete all participants (and related message recipients) for a conference."""
     participant_ids = db.session.execute(
@@ -326,30 +602,33 @@ def manage_participants():
     
     search = request.args.get('search', '')
     participant_type = request.args.get('type', '')
-    
-    query = Participant.query.filter_by(conference_id=current_user.conference_id)
-    
-    if search:
-        trimmed_search = search.strip()
-        query = query.filter(
-            db.or_(
-                Participant.first_name.ilike(f'%{trimmed_search}%'),
-                Participant.last_name.ilike(f'%{trimmed_search}%'),
-                Participant.phone.ilike(f'%{trimmed_search}%'),
-                db.func.concat(Participant.first_name, ' ', Participant.last_name).ilike(f'%{trimmed_search}%')
-            )
-        )
-    
-    if participant_type:
-        query = query.filter_by(participant_type=participant_type)
-    
-    participants = query.order_by(Participant.last_name).all()
+
+    after = None
+    if request.args.get('after_id'):
+        after = (request.args.get('after_name', ''), request.args.get('after_id', type=int))
+
+    participants, next_cursor = search_participants(
+        current_user.conference_id,
+        search=search,
+        participant_type=participant_type,
+        after=after
+    )
     participant_types = ['Delegate', 'Advisor', 'Staff', 'Secretariat']
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return render_template('partials/participants_table.html', participants=participants, participant_types=participant_types)
+        return jsonify({
+            'rows': render_template('partials/participant_rows.html', participants=participants),
+            'next_cursor': {'after_name': next_cursor[0], 'after_id': next_cursor[1]} if next_cursor else None
+        })
  
-    return render_template('manage_participants.html', participants=participants, participant_types=participant_types, search=search, current_type=participant_type)
+    return render_template(
+        'manage_participants.html',
+        participants=participants,
+        participant_types=participant_types,
+        search=search,
+        current_type=participant_type,
+        next_cursor=next_cursor
+    )
 
 
 @routes.route('/participant/<int:participant_id>', methods=['GET'])
@@ -368,15 +647,24 @@ def get_participant(participant_id):
 @login_required
 def add_participant():
     data = request.get_json()
+    phone, phone_error = normalize_phone(data.get('phone', ''))
+    if phone_error:
+        return jsonify({'status': 'error', 'message': PHONE_ERROR_MESSAGES[phone_error], 'error_code': phone_error}), 400
+
     participant = Participant(
         conference_id=current_user.conference_id,
         first_name=data['first_name'],
         last_name=data['last_name'],
-        phone=clean_phone_number(data['phone']),
+        phone=phone,
         participant_type=data['participant_type'],
     )
     db.session.add(participant)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'A participant with this phone number already exists'}), 400
+    adjust_participant_count(participant.conference_id, participant.participant_type, 1)
     return jsonify({'status': 'success'})
 
 @routes.route('/participant/<int:participant_id>', methods=['PUT'])
@@ -388,12 +676,25 @@ def update_participant(participant_id):
     if not data:
         return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
 
+    phone, phone_error = normalize_phone(data.get('phone', ''))
+    if phone_error:
+        return jsonify({'status': 'error', 'message': PHONE_ERROR_MESSAGES[phone_error], 'error_code': phone_error}), 400
+
+    previous_type = participant.participant_type
     participant.first_name = data['first_name']
     participant.last_name = data['last_name']
-    participant.phone = clean_phone_number(data['phone'])
+    participant.phone = phone
     participant.participant_type = data['participant_type']
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'A participant with this phone number already exists'}), 400
+
+    if previous_type != participant.participant_type:
+        adjust_participant_count(participant.conference_id, previous_type, -1)
+        adjust_participant_count(participant.conference_id, participant.participant_type, 1)
 
     return jsonify({'status': 'success'})
 
@@ -403,6 +704,7 @@ def delete_participant(participant_id):
     participant = Participant.query.get_or_404(participant_id)
     db.session.delete(participant)
     db.session.commit()
+    adjust_participant_count(participant.conference_id, participant.participant_type, -1)
     return jsonify({'status': 'success', 'message': 'Participant deleted'})
 
 @routes.route('/participants/clear', methods=['POST'])
@@ -414,23 +716,13 @@ def clear_all_participants():
     try:
         clear_conference_participants(current_user.conference_id)
         db.session.commit()
+        participant_count_cache.invalidate(current_user.conference_id)
         return jsonify({'status': 'success'})
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error clearing participants: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Failed to delete participants'}), 500
 
-def clean_phone_number(phone:str) -> str:
-    """Clean and validate phone number"""
-    phone = re.sub(r'\D', '', phone)
-    if len(phone) == 10:
-        return '+1' + phone
-    elif len(phone) == 11 and phone.startswith('1'):
-        return '+' + phone
-    elif len(phone) == 12 and phone.startswith('+1'):
-        return phone
-    return None
-
 ################### MESSAGING ###################
 
 @routes.route('/send_message', methods=['GET', 'POST'])
@@ -447,7 +739,7 @@ def send_message():
 
         return render_template(
             'send_message.html',
-            conference=current_user.conference,
+            conference=get_conference(current_user.conference_id),
             secretariat_members=secretariat_members
         )
 
@@ -459,6 +751,11 @@ def send_message():
     if not message_content or not recipient_types:
         return jsonify({'success': False, 'message': 'Message content and at least one recipient type are required'}), 400
 
+    try:
+        compile_template(message_content)
+    except TemplateError as e:
+        return jsonify({'success': False, 'message': f'Invalid message: {str(e)}'}), 400
+
     valid_types = {'Delegate', 'Advisor', 'Staff', 'Secretariat'}
     selected_types = set(recipient_types).intersection(valid_types)
     individual_secretariat_names = [r for r in recipient_types if r not in valid_types]
@@ -512,8 +809,9 @@ def send_message():
         scheduled_at=scheduled_at
     )
     db.session.add(message_entry)
-    db.session.commit()
+    db.session.flush()
 
+    # the pending recipient rows are the outbox; commit them together with the message
     message_recipients = [
         MessageRecipient(
             message_id=message_entry.id,
@@ -526,154 +824,288 @@ def send_message():
     db.session.bulk_save_objects(message_recipients)
     db.session.commit()
 
-    if not scheduled_at:
-        if not send_messages_now(message_entry, recipients):
-            # print("Falling back to backup sending method...")
-            send_messages_now_backup(message_entry, recipients)
+    if scheduled_at:
+        message_scheduler = current_app.extensions.get('message_scheduler')
+        if message_scheduler:
+            message_scheduler.reload()
+        return jsonify({'success': True, 'message': 'Message scheduled successfully'})
+
+    outbox_worker = current_app.extensions.get('outbox_worker')
+    if outbox_worker:
+        outbox_worker.wake()
 
     return jsonify({
         'success': True,
-        'message': 'Message scheduled successfully' if scheduled_at else 'Message sent successfully'
+        'message': f'Message queued for delivery to {len(recipients)} recipients'
     })
  
-def send_messages_now(message_entry: Message, recipients):
-    # print(f"Sending Message ID: {message_entry.id} to {len(recipients)} recipients")
-    
-    # store the current application context
-    ctx = current_app._get_current_object()
+def get_sms_dispatcher():
+    """Build an async dispatcher for the configured SMS provider."""
+    return SmsDispatcher(
+        current_app.extensions['sms_provider'],
+        current_app.extensions['sender_pool'],
+        concurrency=current_app.config.get('SMS_DISPATCH_CONCURRENCY', 100)
+    )
 
-    def send_to_recipient(recipient):
-        # push a new application context for this thread
-        with ctx.app_context():
-            try:
-                personalized_message = message_entry.content.format(
-                    first_name=recipient.first_name,
-                    last_name=recipient.last_name,
-                    phone=recipient.phone,
-                    participant_type=recipient.participant_type
-                )
-                
-                response = send_sms_twilio(recipient.phone, personalized_message)
-                
-                if response['status'] == 'sent':
-                    # Create recipient entry
-                    message_recipient = MessageRecipient(
-                        message_id=message_entry.id,
-                        participant_id=recipient.id,
-                        status='sent',
-                        sent_at=datetime.now()
-                    )
-                    # Return the recipient entry to be added in the main thread
-                    return {
-                        "success": True,
-                        "recipient": message_recipient,
-                        "error": None
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "recipient": None,
-                        "error": response.get('error', 'Unknown error')
-                    }
-            
-            except Exception as e:
-                return {
-                    "success": False,
-                    "recipient": None,
-                    "error": str(e)
-                }
+def build_dispatch_jobs(message_entry: Message, recipients):
+    """Render the message for each recipient.
+
+    Returns the dispatcher jobs and a dict of participant id -> error for
+    recipients whose message could not be rendered.
+    """
     try:
-        # Execute in thread pool
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [executor.submit(send_to_recipient, recipient) for recipient in recipients]
-            results = [future.result() for future in futures]
-
-        # Process results in main thread where we already have app context
-        sent_count = 0
-        failed_count = 0
-        
-        # Batch add successful message recipients
-        successful_recipients = [
-            result["recipient"] for result in results 
-            if result["success"] and result["recipient"] is not None
-        ]
-        
-        if successful_recipients:
-            db.session.bulk_save_objects(successful_recipients)
-            sent_count = len(successful_recipients)
-        
-        failed_count = len(results) - sent_count
-        
-        # Log failures
-        for result in results:
-            if not result["success"]:
-                # print(f"Message sending failed: {result['error']}")
-                continue
-        
+        render = compile_template(message_entry.content).renderer()
+    except TemplateError as e:
+        # only messages stored before bodies were validated can get here
+        return [], {
+            recipient.id: f"Error processing {recipient.first_name} {recipient.last_name}: {str(e)}"
+            for recipient in recipients
+        }
+
+    jobs = []
+    errors = {}
+    for recipient in recipients:
+        try:
+            personalized_message = render(recipient)
+        except Exception as e:
+            errors[recipient.id] = f"Error processing {recipient.first_name} {recipient.last_name}: {str(e)}"
+            continue
+        jobs.append({'participant_id': recipient.id, 'to': recipient.phone, 'body': personalized_message})
+    return jobs, errors
+
+def stream_message_recipients(message_id, chunk_size=1000):
+    """Recipients still waiting for a message, in chunks of `chunk_size`.
+
+    Yields lists of (participant, MessageRecipient id, attempts so far). Only
+    rows still `pending` are returned, so a send that is picked up again after
+    a crash doesn't repeat finished sends. Each chunk is one joined query that
+    continues after the last row id of the previous one, so no cursor stays
+    open while the caller commits and sends between chunks, and a large
+    audience is never held in memory all at once.
+    """
+    after_id = 0
+    while True:
+        chunk = db.session.execute(
+            db.select(Participant, MessageRecipient.id, MessageRecipient.attempts).join(
+                MessageRecipient, MessageRecipient.participant_id == Participant.id
+            ).where(
+                MessageRecipient.message_id == message_id,
+                MessageRecipient.status == 'pending',
+                MessageRecipient.id > after_id
+            ).order_by(MessageRecipient.id).limit(chunk_size)
+        ).all()
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after_id = chunk[-1][1]
+
+def send_scheduled_message(message_entry: Message):
+    """Send a due scheduled message to the recipients stored when it was scheduled."""
+    chunk_size = current_app.config.get('SCHEDULER_RECIPIENT_CHUNK_SIZE', 1000)
+    counts = send_messages_now(message_entry, stream_message_recipients(message_entry.id, chunk_size))
+    if counts is None:
+        counts = retry_unsent_recipients(message_entry)
+    return counts
+
+def get_delivery_ledger(message_id, recipients, claimed_by=None):
+    """A ledger for a message's recipient rows, flushing and retrying as configured."""
+    return DeliveryLedger(
+        message_id,
+        recipients,
+        retry_policy=current_app.extensions['retry_policy'],
+        flush_size=current_app.config.get('DELIVERY_FLUSH_SIZE', 500),
+        flush_interval=current_app.config.get('DELIVERY_FLUSH_INTERVAL', 0.5),
+        claimed_by=claimed_by
+    )
+
+def send_messages_now(message_entry: Message, recipient_chunks):
+    """Send a message to every recipient concurrently, one chunk at a time.
+
+    `recipient_chunks` is an iterable of lists of (participant, MessageRecipient
+    id, attempts so far), such as `stream_message_recipients` yields; only one
+    chunk's jobs are held in memory. Outcomes are written back to the message's
+    recipient rows as they arrive; retryable failures are left for the outbox
+    worker to try again. Returns a dict with the sent, failed and retrying
+    counts, or None if the blast could not be dispatched at all.
+    """
+    ledger = None
+    try:
+        ledger = get_delivery_ledger(message_entry.id, {})
+        dispatcher = get_sms_dispatcher()
+        for chunk in recipient_chunks:
+            # outcomes are matched to their rows as they are recorded, so the map only needs this chunk
+            ledger.recipients = {
+                participant.id: (recipient_id, attempts or 0) for participant, recipient_id, attempts in chunk
+            }
+            jobs, render_errors = build_dispatch_jobs(message_entry, [participant for participant, _, _ in chunk])
+            for participant_id, error in render_errors.items():
+                ledger.record({'participant_id': participant_id, 'status': 'failed', 'error': error})
+
+            # hand the connection back to the pool while the sends are in flight; each ledger flush borrows one briefly
+            db.session.commit()
+            dispatcher.send_all(jobs, on_result=ledger.record)
+        ledger.flush()
+
         # Update message status
         message_entry.status = "sent"
         db.session.commit()
-        # print(f"Bulk Message Sent: {sent_count}, Failed: {failed_count}")
 
-        # flash("Message sent successfully!", "success")
-        return True
+        current_app.logger.info(
+            f"Message {message_entry.id} sent: {ledger.sent}, failed: {ledger.failed}, retrying: {ledger.retrying}"
+        )
+        return {'sent': ledger.sent, 'failed': ledger.failed, 'retrying': ledger.retrying}
 
     except Exception as e:
-        # print(f"Bulk sending failed with error: {str(e)}. Falling back to backup method.")
-        return False 
-    
-def send_messages_now_backup(message_entry:Message, recipients):
-    # print(f"[BACKUP] Sending Message ID: {message_entry.id} to {len(recipients)} recipients")
+        # outcomes the ledger hadn't written yet must land before the leftover rows are requeued
+        if ledger is None or not ledger.salvage():
+            db.session.rollback()
+        current_app.logger.error(f"Bulk sending of message {message_entry.id} failed: {str(e)}. Retrying unsent recipients.")
+        return None
+
+def retry_unsent_recipients(message_entry: Message):
+    """Hand every recipient without a recorded outcome to the outbox worker's retry queue.
+
+    Used when a blast fails as a whole; recipients whose outcome was already
+    written are left alone, so nobody gets the message twice.
+    """
+    retry_policy = current_app.extensions['retry_policy']
+    retrying = db.session.execute(
+        db.update(MessageRecipient).where(
+            MessageRecipient.message_id == message_entry.id,
+            MessageRecipient.status == 'pending'
+        ).values(
+            status='retrying',
+            attempts=MessageRecipient.attempts + 1,
+            next_attempt_at=datetime.now() + timedelta(seconds=retry_policy.backoff(1)),
+            error_message='Dispatch failed'
+        )
+    ).rowcount
+    message_entry.status = "sent"
+    db.session.commit()
+    return {'sent': 0, 'failed': 0, 'retrying': retrying}
 
-    sent_count = 0
-    failed_count = 0
-    errors = []
+def message_history_page(sent_by, before=None, limit=MESSAGE_HISTORY_PAGE_SIZE):
+    """One page of an admin's messages, newest first, with their delivery counters.
 
-    for recipient in recipients:
+    `before` is the (sent_at, id) cursor returned with the previous page.
+    Returns (messages, next_cursor); next_cursor is None on the last page.
+    """
+    query = db.select(Message).where(Message.sent_by == sent_by)
+    if before:
+        query = query.where(db.tuple_(Message.sent_at, Message.id) < db.tuple_(*before))
+
+    messages = db.session.execute(
+        query.order_by(Message.sent_at.desc(), Message.id.desc()).limit(limit + 1)
+    ).scalars().all()
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = (messages[-1].sent_at, messages[-1].id)
+
+    return messages, next_cursor
+
+@routes.route('/messages', methods=['GET'])
+@login_required
+def message_history():
+    before = None
+    if request.args.get('before_id'):
         try:
-            personalized_message = message_entry.content.format(
-                first_name=recipient.first_name,
-                last_name=recipient.last_name,
-                phone=recipient.phone,
-                participant_type=recipient.participant_type
-            )
+            before = (datetime.fromisoformat(request.args['before_at']), request.args.get('before_id', type=int))
+        except (KeyError, ValueError):
+            return redirect(url_for('routes.message_history'))
 
-            response = send_sms_twilio(recipient.phone, personalized_message)
+    messages, next_cursor = message_history_page(current_user.id, before=before)
+    return render_template(
+        'message_history.html',
+        conference=get_conference(current_user.conference_id),
+        messages=messages,
+        next_cursor=next_cursor,
+        paged=before is not None
+    )
 
-            if response['status'] == 'sent':
-                message_recipient = MessageRecipient(
-                    message_id=message_entry.id,
-                    participant_id=recipient.id,
-                    status='sent',
-                    sent_at=datetime.now()
-                )
-                db.session.add(message_recipient)
-                sent_count += 1
-            else:
-                failed_count += 1
-                errors.append(f"Failed to send message to {recipient.first_name} {recipient.last_name}: {response['error']}")
 
-        except Exception as e:
-            failed_count += 1
-            errors.append(f"Error processing {recipient.first_name} {recipient.last_name}: {str(e)}")
+################### EXPORTS ###################
 
-    message_entry.status = "sent"
-    db.session.commit()
-    # print(f"[BACKUP] Message {message_entry.id} Sent: {sent_count}, Failed: {failed_count}, Errors: {errors}")
+def stream_csv(header, query):
+    """Yield a CSV of `header` and the rows of `query`, EXPORT_CHUNK_SIZE rows at a time.
 
-    # flash("Message sent successfully!", "success")
+    The header goes out before the query runs. Rows are read with yield_per
+    (a server-side cursor on Postgres), so only one chunk is ever in memory
+    however large the export.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
 
-def send_sms_twilio(to:str, message:str):
-    """Send SMS using Twilio API."""
-    try:
-        message = twilio_client.messages.create(
-            from_=twilio_number,
-            to=to,
-            body=message
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    for rows in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value for value in row]
+            for row in rows
         )
-        return {'status': 'sent', 'sid': message.sid}
-    except Exception as e:
-        return {'status': 'failed', 'error': str(e)}
+        yield buffer.getvalue()
+
+def csv_download(filename, header, query):
+    return Response(
+        stream_with_context(stream_csv(header, query)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{secure_filename(filename)}"'}
+    )
+
+@routes.route('/participants/export.csv', methods=['GET'])
+@login_required
+def export_participants():
+    """The conference roster, in the same columns the participant upload takes."""
+    if not current_user.conference_id:
+        return redirect(url_for('routes.select_conference'))
+
+    query = db.select(
+        Participant.first_name, Participant.last_name, Participant.phone, Participant.participant_type
+    ).where(Participant.conference_id == current_user.conference_id).order_by(Participant.id)
+
+    participant_type = request.args.get('type', '')
+    if participant_type:
+        query = query.where(Participant.participant_type == participant_type)
+
+    conference = get_conference(current_user.conference_id)
+    filename = f"{conference.name}-{participant_type or 'participants'}-{datetime.now():%Y%m%d}.csv"
+    return csv_download(filename, ['first_name', 'last_name', 'phone', 'participant_type'], query)
+
+@routes.route('/messages/<int:message_id>/report.csv', methods=['GET'])
+@login_required
+def export_message_report(message_id):
+    """Per-recipient delivery outcome of one message."""
+    message = Message.query.get_or_404(message_id)
+    if message.sent_by != current_user.id:
+        flash('You do not have permission to view this report', 'danger')
+        return redirect(url_for('routes.dashboard'))
+
+    query = db.select(
+        Participant.first_name,
+        Participant.last_name,
+        Participant.phone,
+        Participant.participant_type,
+        MessageRecipient.status,
+        MessageRecipient.attempts,
+        MessageRecipient.sent_at,
+        MessageRecipient.delivery_status,
+        MessageRecipient.delivered_at,
+        MessageRecipient.provider_sid,
+        MessageRecipient.error_message
+    ).join(
+        Participant, Participant.id == MessageRecipient.participant_id
+    ).where(MessageRecipient.message_id == message.id).order_by(MessageRecipient.id)
+
+    header = [
+        'first_name', 'last_name', 'phone', 'participant_type', 'status', 'attempts', 'sent_at',
+        'delivery_status', 'delivered_at', 'provider_sid', 'error_message'
+    ]
+    return csv_download(f'message-{message.id}-report.csv', header, query)
 
 
 ################### SCHEDULING ###################
@@ -700,6 +1132,10 @@ def cancel_scheduled_message(message_id):
         db.session.commit()
         flash('Scheduled message has been cancelled', 'success')
 
+        message_scheduler = current_app.extensions.get('message_scheduler')
+        if message_scheduler:
+            message_scheduler.reload()
+
     except Exception as e:
         db.session.rollback()
         flash('Error cancelling message', 'danger')
@@ -721,3 +1157,35 @@ def check_scheduled_messages():
         })
     
     return jsonify({"messages": messages_data})
+
+@routes.route('/sms/status', methods=['POST'])
+def sms_status_callback():
+    """Delivery receipt from the SMS provider (Twilio's StatusCallback)."""
+    auth_token = current_app.config.get('TWILIO_AUTH_TOKEN')
+    if auth_token and current_app.config.get('SMS_STATUS_CALLBACK_VALIDATE'):
+        url = current_app.config.get('SMS_STATUS_CALLBACK_URL') or request.url
+        signature = request.headers.get('X-Twilio-Signature', '')
+        if not RequestValidator(auth_token).validate(url, request.form, signature):
+            return jsonify({'status': 'error', 'message': 'Invalid signature'}), 403
+
+    # capture callbacks for benchmarks/replay_status_callbacks.py
+    record_path = current_app.config.get('SMS_STATUS_CALLBACK_RECORD_PATH')
+    if record_path:
+        with open(record_path, 'a') as record_file:
+            record_file.write(json.dumps(request.form.to_dict()) + '\n')
+
+    accepted = current_app.extensions['receipt_buffer'].add(
+        request.form.get('MessageSid'),
+        request.form.get('MessageStatus'),
+        request.form.get('ErrorCode')
+    )
+    if not accepted:
+        return jsonify({'status': 'error', 'message': 'Missing or unknown MessageSid/MessageStatus'}), 400
+    return '', 204
+
+@routes.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """The app's metrics in the Prometheus text format, merged across processes when METRICS_DIR is set."""
+    if not metrics.authorized(request.headers.get('Authorization'), current_app.config.get('METRICS_TOKEN')):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
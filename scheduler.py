@@ -0,0 +1,208 @@
+import heapq
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from extensions import db
+from models import Message
+import metrics
+
+
+class MessageScheduler:
+    """Send scheduled messages the moment they fall due.
+
+    Keeps a heap of upcoming (due_at, message_id) pairs and sleeps until the
+    earliest one instead of polling Message on a fixed interval. `reload()` is
+    called whenever a message is scheduled or cancelled in this process; a
+    periodic reconciliation reloads the heap from the database as well, which
+    picks up messages scheduled through other processes and corrects any drift.
+
+    Every app process runs a scheduler. A due message is claimed (marked
+    `sending` under this scheduler's id) before it is sent, one message at a
+    time, so replicas share the due messages and never send the same one
+    twice. The claim is a lease renewed while the message is being sent; a
+    claim whose lease lapsed because its process died is picked up again.
+
+    With OUTBOX_WORKER=external a due message is handed to the outbox workers
+    instead of being sent here, so only those processes deliver.
+    """
+
+    def __init__(self, app, reconcile_interval=30.0, lease_seconds=300):
+        self.app = app
+        self.reconcile_interval = reconcile_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = []
+        self._reload = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload(self):
+        """Rebuild the queue from the database before the next wait."""
+        self._reload.set()
+        self._wake.set()
+
+    def start(self):
+        """Run the scheduler loop in a daemon thread of the current process."""
+        self._thread = threading.Thread(target=self.run, name='message-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def next_due(self):
+        return self._queue[0][0] if self._queue else None
+
+    def run(self):
+        self.app.logger.info(f"Message scheduler {self.worker_id} started")
+        next_reconcile = 0
+        while not self._stop.is_set():
+            if self._reload.is_set() or time.monotonic() >= next_reconcile:
+                self._reload.clear()
+                try:
+                    self.load_queue()
+                except Exception as e:
+                    self.app.logger.error(f"Scheduler reload error: {str(e)}")
+                next_reconcile = time.monotonic() + self.reconcile_interval
+
+            next_due = self.next_due()
+            if next_due and next_due <= datetime.now():
+                self.pop_due()
+                try:
+                    self.send_due()
+                except Exception as e:
+                    # the messages are still scheduled in the database; reconciliation brings them back
+                    self.app.logger.error(f"Scheduler error: {str(e)}")
+                continue
+
+            timeout = next_reconcile - time.monotonic()
+            if next_due:
+                timeout = min(timeout, (next_due - datetime.now()).total_seconds())
+            self._wake.wait(max(timeout, 0))
+            self._wake.clear()
+
+    def load_queue(self):
+        with self.app.app_context():
+            rows = db.session.execute(
+                db.select(Message.status, Message.scheduled_at, Message.claimed_at, Message.id).where(
+                    db.or_(
+                        db.and_(Message.status == 'scheduled', Message.scheduled_at.isnot(None)),
+                        Message.status == 'sending'
+                    )
+                )
+            ).all()
+
+        lease = timedelta(seconds=self.lease_seconds)
+        queue = []
+        for status, scheduled_at, claimed_at, message_id in rows:
+            if status == 'scheduled':
+                queue.append((scheduled_at, message_id))
+            elif claimed_at:
+                # being sent elsewhere; due again only if that claim's lease runs out
+                queue.append((claimed_at + lease, message_id))
+        heapq.heapify(queue)
+        self._queue = queue
+
+    def pop_due(self):
+        """Drop every entry that is due now; `send_due` claims them all in one pass."""
+        now = datetime.now()
+        while self._queue and self._queue[0][0] <= now:
+            heapq.heappop(self._queue)
+
+    def send_due(self):
+        """Claim and send due messages one at a time until none are left."""
+        from routes import send_scheduled_message
+
+        with self.app.app_context():
+            while not self._stop.is_set():
+                message = self.claim_next()
+                if message is None:
+                    return
+                if message.scheduled_at:
+                    metrics.scheduler_lag.observe(max((datetime.now() - message.scheduled_at).total_seconds(), 0))
+
+                if self.app.config['OUTBOX_WORKER'] == 'external':
+                    # its recipient rows are already pending; the outbox claims them once the message is
+                    message.status = 'pending'
+                    message.sent_at = datetime.now()
+                    db.session.commit()
+                    self.app.logger.info(f"Scheduled message {message.id} handed to the outbox")
+                    continue
+
+                with self.hold_lease(message.id):
+                    try:
+                        counts = send_scheduled_message(message)
+                        self.app.logger.info(
+                            f"Scheduled message {message.id} sent: {counts['sent']}, failed: {counts['failed']}"
+                        )
+                        message.status = "sent"
+                        message.sent_at = datetime.now()
+                    except Exception as e:
+                        db.session.rollback()
+                        self.app.logger.error(f"Error processing message {message.id}: {str(e)}")
+                        message.status = "error"
+                    db.session.commit()
+
+    def claim_next(self):
+        """Mark the earliest due message as being sent by this scheduler and return it."""
+        now = datetime.now()
+        claimable = db.or_(
+            db.and_(Message.status == 'scheduled', Message.scheduled_at <= now),
+            db.and_(
+                Message.status == 'sending',
+                Message.claimed_at < now - timedelta(seconds=self.lease_seconds)
+            )
+        )
+
+        query = db.select(Message.id).where(claimable).order_by(Message.scheduled_at, Message.id).limit(1)
+        if db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+
+        message_id = db.session.execute(query).scalar()
+        if message_id is None:
+            db.session.rollback()
+            return None
+
+        # the guard makes the claim safe on databases without SKIP LOCKED
+        claimed = db.session.execute(
+            db.update(Message).where(Message.id == message_id, claimable)
+            .values(status='sending', claimed_by=self.worker_id, claimed_at=now)
+        ).rowcount
+        db.session.commit()
+
+        if not claimed:
+            # another scheduler won the race; look for the next one
+            return self.claim_next()
+        return db.session.get(Message, message_id)
+
+    @contextmanager
+    def hold_lease(self, message_id):
+        """Keep renewing this scheduler's claim on a message while the block runs."""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    with self.app.app_context():
+                        db.session.execute(
+                            db.update(Message).where(
+                                Message.id == message_id,
+                                Message.claimed_by == self.worker_id
+                            ).values(claimed_at=datetime.now())
+                        )
+                        db.session.commit()
+                except Exception as e:
+                    self.app.logger.error(f"Lease renewal of message {message_id} failed: {str(e)}")
+
+        renewer = threading.Thread(target=renew, name=f'message-lease-{message_id}', daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            done.set()
+            renewer.join()
@@ -0,0 +1,98 @@
+from sqlalchemy import event
+from extensions import db
+from models import Participant
+
+PAGE_SIZE = 100  # participants per page of search results
+
+# SQLite: an FTS5 trigram table over name and phone, kept in sync with participant by triggers
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS participant_fts USING fts5(name, phone, tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS participant_fts_insert AFTER INSERT ON participant BEGIN
+        INSERT INTO participant_fts(rowid, name, phone) VALUES (new.id, new.first_name || ' ' || new.last_name, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS participant_fts_update AFTER UPDATE ON participant BEGIN
+        UPDATE participant_fts SET name = new.first_name || ' ' || new.last_name, phone = new.phone WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS participant_fts_delete AFTER DELETE ON participant BEGIN
+        DELETE FROM participant_fts WHERE rowid = old.id;
+    END""",
+]
+
+# Postgres: a trigram GIN index on the same expression the search predicate uses
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_participant_search_trgm ON participant "
+    "USING gin ((first_name || ' ' || last_name || ' ' || phone) gin_trgm_ops)",
+]
+
+TRIGRAM_MIN_LENGTH = 3  # shorter terms can't use a trigram index
+
+
+@event.listens_for(Participant.__table__, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Build the search index alongside the table when the schema is created with create_all."""
+    statements = {'sqlite': SQLITE_SEARCH_DDL, 'postgresql': POSTGRES_SEARCH_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Participant.__table__, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS participant_fts")
+
+
+def search_predicate(term:str):
+    """WHERE clause matching `term` anywhere in a participant's full name or phone."""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite' and len(term) >= TRIGRAM_MIN_LENGTH:
+        fts_query = '"' + term.replace('"', '""') + '"'
+        return Participant.id.in_(
+            db.select(db.literal_column('rowid'))
+            .select_from(db.table('participant_fts'))
+            .where(db.text('participant_fts MATCH :fts_query').bindparams(fts_query=fts_query))
+        )
+
+    if dialect == 'postgresql':
+        separator = db.literal_column("' '")
+        searchable = Participant.first_name.op('||')(separator).op('||')(Participant.last_name) \
+            .op('||')(separator).op('||')(Participant.phone)
+        return searchable.ilike(f'%{term}%')
+
+    return db.or_(
+        Participant.first_name.ilike(f'%{term}%'),
+        Participant.last_name.ilike(f'%{term}%'),
+        Participant.phone.ilike(f'%{term}%'),
+        (Participant.first_name + ' ' + Participant.last_name).ilike(f'%{term}%')
+    )
+
+
+def search_participants(conference_id, search='', participant_type='', after=None, limit=PAGE_SIZE):
+    """One page of a conference's participants ordered by last name, then id.
+
+    `after` is the (last_name, id) cursor returned with the previous page.
+    Returns (participants, next_cursor); next_cursor is None on the last page.
+    """
+    query = db.select(Participant).where(Participant.conference_id == conference_id)
+
+    term = search.strip()
+    if term:
+        query = query.where(search_predicate(term))
+
+    if participant_type:
+        query = query.where(Participant.participant_type == participant_type)
+
+    if after:
+        query = query.where(db.tuple_(Participant.last_name, Participant.id) > db.tuple_(*after))
+
+    participants = db.session.execute(
+        query.order_by(Participant.last_name, Participant.id).limit(limit + 1)
+    ).scalars().all()
+
+    next_cursor = None
+    if len(participants) > limit:
+        participants = participants[:limit]
+        next_cursor = (participants[-1].last_name, participants[-1].id)
+
+    return participants, next_cursor
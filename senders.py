@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import zlib
+
+
+class TokenBucket:
+    """Token bucket limiting how fast one sender may submit messages.
+
+    Callers reserve a token up front and then wait out whatever deficit their
+    reservation created, so waiters are served in the order they arrived and no
+    more than `rate` messages per second (after the initial `burst`) get through.
+    Safe to share between threads and event loops.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def penalize(self, seconds):
+        """Stop handing out tokens for `seconds`, e.g. after the provider answered 429."""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def refund(self):
+        """Give back a reserved token that was never used, e.g. by a send called off while it waited."""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.refund()
+                raise
+
+
+class Sender:
+    """One from-number (or messaging service) and its rate limit."""
+
+    def __init__(self, params, rate, burst=1):
+        self.params = params  # Twilio API parameters identifying the sender
+        self.bucket = TokenBucket(rate, burst)
+
+    @property
+    def name(self):
+        return self.params.get('From') or self.params.get('MessagingServiceSid')
+
+
+class SenderPool:
+    """Spread outgoing messages over several sending numbers.
+
+    A recipient always maps to the same sender (by a stable hash of their
+    phone number), so a delegate sees every text come from one number. Each
+    sender has its own token bucket, so a blast runs at the sum of the
+    senders' rates. A messaging-service SID is treated as a single sender
+    whose rate is the service's throughput.
+
+    The buckets only see this process's sends, so with SMS_DELIVERY_PROCESSES
+    set each process gets an equal share of every sender's rate and burst.
+    """
+
+    def __init__(self, senders):
+        self.senders = senders
+
+    @classmethod
+    def from_config(cls, config):
+        processes = max(1, config.get('SMS_DELIVERY_PROCESSES', 1))
+        rate = config['SMS_SENDER_RATE'] / processes
+        burst = config['SMS_SENDER_BURST'] / processes
+        service_sid = config.get('TWILIO_MESSAGING_SERVICE_SID')
+        if service_sid:
+            return cls([Sender({'MessagingServiceSid': service_sid}, rate, burst)])
+
+        numbers = [number.strip() for number in config['TWILIO_PHONE_NUMBERS'].split(',') if number.strip()]
+        # with nothing configured keep one unnamed sender so requests fail at the provider, as before
+        return cls([Sender({'From': number}, rate, burst) for number in numbers or [None]])
+
+    def sender_for(self, phone:str) -> Sender:
+        if len(self.senders) == 1:
+            return self.senders[0]
+        return self.senders[zlib.crc32(phone.encode()) % len(self.senders)]
+
+    @property
+    def total_rate(self):
+        return sum(sender.bucket.rate for sender in self.senders)